@@ -0,0 +1,100 @@
+"""
+Access log for the app.
+
+Lines are put on a queue and written by a background thread, in batches
+at most every `interval` seconds, so a request never waits for the disk.
+The log file is only ever appended to, under the same kind of lock as
+the data files, and rotated (to .1, .2, ...) when it grows above
+`max_bytes`. This makes it safe to share between gunicorn workers, and
+nothing is lost when a worker restarts.
+"""
+
+import atexit
+import datetime as dt
+import os
+import queue
+import threading
+import time
+import metrics
+import storage
+
+
+class AccessLog:
+    def __init__(self, filename, max_bytes=1000000, backups=5, interval=1.0):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._lines = None
+        self._thread = None
+        atexit.register(self.close)
+
+    def log(self, message):
+        """Add a line with the current time and message to the log."""
+        nowstr = dt.datetime.now().isoformat(timespec='seconds', sep=' ')
+        self._start()
+        self._lines.put(nowstr + ' ' + message + '\n')
+
+    def close(self):
+        """Write the queued lines and stop the writer thread."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._lines.put(None)
+            self._thread.join(timeout=10)
+            self._pid = None
+
+    def _start(self):
+        # The writer is started on first use, and again in a forked worker
+        # (e.g. with gunicorn --preload), where the thread doesn't exist.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._lines = queue.Queue()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._lines,),
+                    name='accesslog', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self, lines):
+        stop = False
+        while not stop:
+            batch = [lines.get()]
+            deadline = time.monotonic() + self.interval
+            while batch[-1] is not None:
+                try:
+                    batch.append(lines.get(
+                        timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                stop = True
+                batch.pop()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        dirname = os.path.dirname(self.filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with metrics.timer('log_write'), storage.locked(self.filename):
+            self._rotate()
+            with open(self.filename, 'a') as logfile:
+                logfile.write(''.join(batch))
+
+    def _rotate(self):
+        try:
+            size = os.path.getsize(self.filename)
+        except FileNotFoundError:
+            return
+        if size < self.max_bytes or self.backups < 1:
+            return
+        for i in range(self.backups - 1, 0, -1):
+            older = self.filename + '.' + str(i)
+            if os.path.exists(older):
+                os.replace(older, self.filename + '.' + str(i + 1))
+        os.replace(self.filename, self.filename + '.1')
@@ -2,27 +2,121 @@
 
 # Run this app with `python app.py` and
 # visit http://127.0.0.1:8050/ in your web browser.
+#
+# With gunicorn, run `gunicorn --preload app:server` (see README.md).
+#
+# Importing this module is cheap: the settings are read, and Dash,
+# plotly, pandas and the data are loaded, only when an app is created
+# (or app.app / app.server is first used).
 
-import dash
-import os
-import dash_core_components as dcc
-import dash_html_components as html
-import dash_auth
-import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from dash.dependencies import Input, Output, State
 import datetime as dt
-import numpy as np
-from flask import request
-from decouple import config
-from dotenv import load_dotenv
 import gettext
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from decouple import Csv, config
+from dotenv import load_dotenv
+import metrics
+
+# The settings (see README.md) as name: (default, cast).
+# The ones without a default must be set.
+SETTINGS = {
+    'APPLANG': (None, str),
+    'LANGUAGES': ('', Csv()),
+    'APPNAME': (None, str),
+    'FAMILY': (None, str),
+    'PARENT': (None, str),
+    'CFILE': (None, str),
+    'GROFILE': (None, str),
+    'P1FILE': (None, str),
+    'P2FILE': (None, str),
+    'LOGFILE': (None, str),
+    'AGECOL': (None, str),
+    'COMCOL': (None, str),
+    'DATECOL': (None, str),
+    'HEADCOL': (None, str),
+    'HEIGHTCOL': (None, str),
+    'WEIGHTCOL': (None, str),
+    'SDWTCOL': (None, str),
+    'SDHTCOL': (None, str),
+    'LMS_WT_COLS': ('L_wt,M_wt,S_wt', Csv()),
+    'LMS_HT_COLS': ('L_ht,M_ht,S_ht', Csv()),
+    'GROWTH_BANDS': ('1', Csv()),
+    'CHILDBDAY': (None, str),
+    'CHILDNAME': (None, str),
+    'MAX_AGE': (None, float),
+    'P1BDAY': (None, str),
+    'P1NAME': (None, str),
+    'P2BDAY': (None, str),
+    'P2NAME': (None, str),
+    'REGISTRY': ('', str),
+    'STORAGE': ('csv', str),
+    'DBFILE': ('data/gottenso.db', str),
+    'SHARED_REFERENCE': (True, bool),
+    'DATA_CACHE_SIZE': (64, int),
+    'JOURNAL_SIZE': (100, int),
+    'LOG_MAX_BYTES': (1000000, int),
+    'LOG_BACKUPS': (5, int),
+    'FIG_CACHE_SIZE': (32, int),
+    'MAX_POINTS': (500, int),
+    'CLIENTSIDE_UNITS': (False, bool),
+    'POLL_SECONDS': (5, float),
+    'COMPRESS_MIN_BYTES': (1000, int),
+    'COMPRESS_CACHE_SIZE': (32, int),
+    'SLOW_CALLBACK_MS': (0, float),
+    'PROFILE_DIR': ('aux/profiles', str),
+}
 
-load_dotenv()
+# The settings of the single family, which aren't needed with a REGISTRY.
+FAMILY_SETTINGS = ('FAMILY', 'PARENT', 'CFILE', 'P1FILE', 'P2FILE',
+                   'CHILDBDAY', 'CHILDNAME', 'P1BDAY', 'P1NAME', 'P2BDAY',
+                   'P2NAME')
 
+external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
+
+localedir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'locales')
+
+# Accept-Language tags answered by a catalog with another name
+LANGUAGE_ALIASES = {'se': ('sv',)}
 
-def load_datafile(filename):
+
+def load_settings(settings=None):
+    """
+    Return a dict with all the settings: the ones given in settings,
+    and the rest from the environment (or the .env file).
+    """
+    load_dotenv()
+    settings = dict(settings or {})
+    registry = settings.get('REGISTRY', config('REGISTRY', default=''))
+    for name, (default, cast) in SETTINGS.items():
+        if name not in settings:
+            if registry and name in FAMILY_SETTINGS:
+                settings[name] = config(name, default='', cast=cast)
+            elif default is None:
+                settings[name] = config(name, cast=cast)
+            else:
+                settings[name] = config(name, default=default, cast=cast)
+    return settings
+
+
+@lru_cache(maxsize=1)
+def default_settings():
+    """The settings from the environment, read once."""
+    return load_settings()
+
+
+def reference_columns(settings):
+    """The columns of the growth curve and parent data that are used."""
+    return [settings[name] for name in
+            ('AGECOL', 'WEIGHTCOL', 'HEIGHTCOL', 'SDWTCOL', 'SDHTCOL')] + \
+        list(settings['LMS_WT_COLS']) + list(settings['LMS_HT_COLS'])
+
+
+def load_datafile(filename, settings=None):
     """
     Load the auxiliary data from a .csv file
     and check the weight / height (i.e. for kg/m instead of g/cm).
@@ -31,20 +125,53 @@ def load_datafile(filename):
     if it doesn't, returns None.
 
     Thus np.any() can check whether the data exists or not.
+
+    Only the age, weight, height and SD columns are read, in chunks.
+    For a file on disk, the result is cached in an .npy file next to it
+    and memory-mapped (read-only) as long as the file is unchanged.
     """
+    import storage
+
+    settings = settings or default_settings()
+
+    def load():
+        return normalize_units(
+            storage.read_columns(filename, reference_columns(settings)),
+            settings)
 
+    version = storage.file_key(filename)
     try:
-        raw_data = pd.read_csv(filename)
-        if max(raw_data[weightcol]) < 1000:
-            raw_data[weightcol] *= 1000
-            if sd_wt_col in raw_data:
-                raw_data[sd_wt_col] *= 1000
-        if max(raw_data[heightcol]) < 5:
-            raw_data[heightcol] *= 100
-            if sd_ht_col in raw_data:
-                raw_data[sd_ht_col] *= 100
+        if version is None:
+            return load()
+        return storage.load_arrays(filename + '.npy', version, load)
     except FileNotFoundError:
-        raw_data = None
+        return None
+
+
+def normalize_units(raw_data, settings=None):
+    """
+    Convert the weight / height of a dataframe to g/cm (in place),
+    if they seem to be given in kg/m. An LMS table without the weight or
+    height column gets it from its median (M).
+    """
+    settings = settings or default_settings()
+    weightcol = settings['WEIGHTCOL']
+    heightcol = settings['HEIGHTCOL']
+    sd_wt_col = settings['SDWTCOL']
+    sd_ht_col = settings['SDHTCOL']
+    # the median (M) of an LMS table is in the same unit as the mean
+    m_wt_col = settings['LMS_WT_COLS'][1]
+    m_ht_col = settings['LMS_HT_COLS'][1]
+    with metrics.timer('normalize'):
+        for col, sd_col, m_col, peak, factor in (
+                (weightcol, sd_wt_col, m_wt_col, 1000, 1000),
+                (heightcol, sd_ht_col, m_ht_col, 5, 100)):
+            if col not in raw_data and m_col in raw_data:
+                raw_data[col] = raw_data[m_col].copy()
+            if col in raw_data and raw_data[col].max() < peak:
+                for scaled in (col, sd_col, m_col):
+                    if scaled in raw_data:
+                        raw_data[scaled] *= factor
     return raw_data
 
 
@@ -64,553 +191,1387 @@ def calc_weight(gram, disp='g'):
         return gram / 1000
 
 
-external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
+# decimals to round the growth curves to, per unit
+DECIMALS = {'g': 1, 'kg': 4, 'cm': 2, 'days': 2, 'years': 4}
 
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 
-app.config['suppress_callback_exceptions'] = True
+def rounded(values, unit):
+    """Round the values of a growth curve for plotting in unit."""
+    import numpy as np
 
-VALID_USERNAME_PASSWORD_PAIRS = {
-    'parent': config('PARENT'),
-    'family': config('FAMILY')
-}
+    return np.round(np.asarray(values, dtype='float64'), DECIMALS[unit])
 
-auth = dash_auth.BasicAuth(
-    app,
-    VALID_USERNAME_PASSWORD_PAIRS
-)
-
-server = app.server
-
-app.title = config('APPNAME')
-p1name = config('P1NAME')
-p2name = config('P2NAME')
-cname = config('CHILDNAME')
-childbday = config('CHILDBDAY')
-p1file = config('P1FILE')
-p2file = config('P2FILE')
-cfile = config('CFILE')
-grofile = config('GROFILE')
-datecol = config('DATECOL')
-agecol = config('AGECOL')
-weightcol = config('WEIGHTCOL')
-heightcol = config('HEIGHTCOL')
-headcol = config('HEADCOL')
-comcol = config('COMCOL')
-sd_wt_col = config('SDWTCOL')
-sd_ht_col = config('SDHTCOL')
-p1bday = config('P1BDAY')
-p2bday = config('P2BDAY')
-logfile_name = config('LOGFILE')
-
-max_age_factor = float(config('MAX_AGE'))
-
-applang = gettext.translation(
-    'base', localedir='locales', languages=[
-        config('APPLANG')])
-applang.install()
-_ = applang.gettext
-
-os.makedirs(os.path.dirname(logfile_name), exist_ok=True)
-
-with open(logfile_name, 'w') as logfile:
-    nowstr = dt.datetime.now().isoformat(timespec='seconds', sep=' ')
-    logstr = nowstr + ' Server rebooted\n'
-    logfile.write(logstr)
-
-hover_age_d = '<b>' + _("Age") + '</b>: %{x} ' + _("days") + '<br>'
-hover_age_y = '<b>' + _("Age") + '</b>: %{x:3.2f} ' + _("years") + '<br>'
-hover_w_g = '<b>' + _("Weight") + '</b>: %{y} ' + 'g <br>%{customdata}'
-hover_w_kg = '<b>' + _("Weight") + '</b>: %{y} ' + 'kg <br>%{customdata}'
-hover_date = '<b>' + _("Date") + '</b>: %{text}<br>'
-
-child_birth = dt.datetime.strptime(childbday, '%Y%m%d')
-h_birth = dt.datetime.strptime(p1bday, '%Y%m%d')
-l_birth = dt.datetime.strptime(p2bday, '%Y%m%d')
-
-p1_raw_data = load_datafile(p1file)
-p2_raw_data = load_datafile(p2file)
-gro_raw_data = load_datafile(grofile)
-
-app.layout = html.Div(children=[
-    dcc.Graph(
-        id='mainplot'
-    ),
-    html.Div(children=[
-        dcc.Checklist(
-            id='checkboxes',
-            options=[
-                {'label': _("Plot") + ' ' + _("weight"), 'value': 'show_wt'},
-                {'label': _("Plot") + ' ' + _("height"), 'value': 'show_ht'},
-                {'label': _("Plot") + ' ' + _("growth curves") + (
-                    _(' (ERROR: not found!)')
-                    if not np.any(gro_raw_data) else ''),
-                 'value': 'gro_curves'},
-                {'label': _("Plot") + ' ' + p1name + ' ' +
-                 _("for comparison") + (
-                    _(' (ERROR: not found!)')
-                    if not np.any(p1_raw_data) else ''),
-                 'value': 'showp1'},
-                {'label': _("Plot") + ' ' + p2name + ' ' +
-                 _("for comparison") + (
-                    _(' (ERROR: not found!)')
-                    if not np.any(p2_raw_data) else ''),
-                 'value': 'showp2'},
-                {'label': _("Zoom in around") + ' ' + cname, 'value': 'zoom'}],
-            value=['show_ht', 'show_wt', 'showp1', 'showp2', 'zoom'],
-            style={'width': '290px'}
-        )], style={'columns': 2, 'margin-right': 'auto',
-                   'margin-left': 'auto', 'width': '600px'}),
-    html.Div(children=[
-        html.Label(_("Weight scale:"),
-                   style={'display': 'inline-block'}),
-        html.Div(style={'display': 'inline-block', 'width': '10px'}),
-        dcc.Dropdown(id='weightdrop',
-                     options=[{'label': _('Grams'), 'value': 'g'},
-                              {'label': _('Kilograms'), 'value': 'kg'}],
-                     value='g',
-                     style={'width': '100px', 'display': 'inline-block',
-                            'top': '15px'}),
-        html.Div(),
-        html.Label(_("Age scale:"), style={'display': 'inline-block'}),
-        html.Div(style={'display': 'inline-block', 'width': '10px'}),
-        dcc.Dropdown(id='agedrop',
-                     options=[{'label': _('Days'), 'value': 'days'},
-                              {'label': _('Years'), 'value': 'years'}],
-                     value='days',
-                     style={'width': '100px', 'display': 'inline-block',
-                            'top': '15px'})
-    ], style={'columns': 2, 'margin-right': 'auto',
-              'margin-left': 'auto', 'width': '600px'}),
-    html.Div(id='input-form'),
-    html.Div(id='numclicks', style={'display': 'none'}, children=0)
-])
-
-
-@app.callback(Output('input-form', 'children'),
-              [Input('checkboxes', 'value')])
-def make_inputs(check):
-    usr = request.authorization['username']
-    with open(logfile_name, 'a') as logfile:
-        nowstr = dt.datetime.now().isoformat(timespec='seconds', sep=' ')
-        logstr = nowstr + ' Connection by ' + usr + '\n'
-        logfile.write(logstr)
-    if usr == 'parent':
-        input_form = html.Div(children=[
-            dcc.Markdown('##### ' + _("Add data point") + ':\n\n'),
-            dcc.DatePickerSingle(
-                id='setdate',
-                min_date_allowed=child_birth,
-                max_date_allowed=child_birth + dt.timedelta(weeks=5200),
-                initial_visible_month=dt.date.today(),
-                date=dt.date.today(),
-                style={'display': 'inline-block'}),
-            html.Div(style={'display': 'inline-block', 'width': '10px'}),
-            html.Label(_('Weight') + ' (g):',
-                       style={'display': 'inline-block'}),
-            html.Div(style={'display': 'inline-block', 'width': '5px'}),
-            dcc.Input(
-                id='new_weight',
-                style={
-                    'display': 'inline-block',
-                    'width': '100px'}),
-            html.Div(style={'display': 'inline-block', 'width': '10px'}),
-            html.Label(_('Height') + ' (cm):',
-                       style={'display': 'inline-block'}),
-            html.Div(style={'display': 'inline-block', 'width': '5px'}),
-            dcc.Input(
-                id='new_height',
-                style={
-                    'display': 'inline-block',
-                    'width': '100px'}),
-            html.Div(style={'display': 'inline-block', 'width': '10px'}),
-            html.Label(_('Head circumference') + ' (cm):', style={
-                       'display': 'inline-block'}),
-            html.Div(style={'display': 'inline-block', 'width': '5px'}),
-            dcc.Input(
-                id='new_head',
-                style={
-                    'display': 'inline-block',
-                    'width': '100px'}),
-            html.Div(style={'display': 'inline-block', 'width': '10px'}),
-            html.Label(_('Comment') + ':', style={'display': 'inline-block'}),
-            html.Div(style={'display': 'inline-block', 'width': '5px'}),
-            dcc.Input(
-                id='new_comment',
-                style={
-                    'display': 'inline-block',
-                    'width': '150px'}),
-            html.Div(style={'display': 'inline-block', 'width': '10px'}),
-            html.Button(
-                _("Submit"),
-                id='submit-button',
-                n_clicks=0,
-                style={
-                    'display': 'inline-block'})
-        ], style={'margin-right': 'auto',
-                  'margin-left': 'auto', 'max-width': '1100px'})
-    else:
-        input_form = ''
-    return input_form
-
-
-@app.callback(
-    Output('numclicks', 'children'),
-    [Input('submit-button', 'n_clicks')],
-    [State('numclicks', 'children'),
-     State('setdate', 'date'),
-     State('new_weight', 'value'),
-     State('new_height', 'value'),
-     State('new_head', 'value'),
-     State('new_comment', 'value')])
-def new_datapoint(clicks, old_clicks, sel_date, new_weight, new_height,
-                  new_head, new_comment, suppress_callback_exceptions=True):
-    c_data = pd.read_csv(cfile)
-    sel_date = dt.date.fromisoformat(sel_date)
-    old_clicks = int(old_clicks)
-
-    if clicks != old_clicks:
-        if new_weight:
-            new_weight = int(new_weight)
+
+def growth_bands(bands):
+    """
+    Parse the GROWTH_BANDS setting: SD multiples ('1', '2') or lower
+    percentiles ('3%', for the band from the 3rd to the 97th). Returns
+    (label, z) for the bands from -z to z, the widest first.
+    """
+    import growth
+
+    parsed = []
+    for band in bands:
+        band = band.strip()
+        if band.endswith('%'):
+            low = float(band[:-1])
+            label = 'P%g-P%g' % (low, 100 - low)
+            parsed.append((label, -float(growth.normal_quantile(low))))
         else:
-            new_weight = np.nan
-        if new_height:
-            new_height = float(new_height)
+            parsed.append(('\u00b1 %g SD' % float(band), float(band)))
+    return sorted(parsed, key=lambda band: -band[1])
+
+
+def labelled(label, values, fmt, unit=''):
+    """
+    Format an array of numbers as label + value + unit strings
+    ('' for NaN).
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype='float64')
+    if not len(values):
+        # np.char.mod gives floats for no values
+        return np.array([], dtype=str)
+    known = ~np.isnan(values)
+    text = np.char.add(np.char.add(
+        label, np.char.mod(fmt, np.where(known, values, 0))), unit)
+    return np.where(known, text, '')
+
+
+def available_languages():
+    """The languages with a compiled catalog in locales/."""
+    return sorted(
+        name for name in os.listdir(localedir) if os.path.exists(
+            os.path.join(localedir, name, 'LC_MESSAGES', 'base.mo')))
+
+
+class Translation:
+    """
+    The texts of the app in one language: its gettext, and the hover
+    templates, axis titles and labels made with it. Made once per
+    language, when the app is created.
+    """
+
+    def __init__(self, language):
+        self.language = language
+        self.gettext = _ = gettext.translation(
+            'base', localedir=localedir, languages=[language]).gettext
+
+        self.hover_age_d = '<b>' + _("Age") + '</b>: %{x} ' + _("days") + \
+            '<br>'
+        self.hover_age_y = '<b>' + _("Age") + '</b>: %{x:3.2f} ' + \
+            _("years") + '<br>'
+        self.hover_w_g = '<b>' + _("Weight") + '</b>: %{y} ' + \
+            'g <br>%{customdata}'
+        self.hover_w_kg = '<b>' + _("Weight") + '</b>: %{y} ' + \
+            'kg <br>%{customdata}'
+        self.hover_h = '<b>' + _("Height") + '</b>: %{y} cm <br>%{customdata}'
+        self.hover_date = '<b>' + _("Date") + '</b>: %{text}<br>'
+        self.axis_age_d = "<b>" + _("Age") + "</b> (" + _("days") + ")"
+        self.axis_age_y = "<b>" + _("Age") + "</b> (" + _("years") + ")"
+        self.axis_w_g = "<b>" + _("Weight") + "</b> (g)"
+        self.axis_w_kg = "<b>" + _("Weight") + "</b> (kg)"
+        self.axis_h = "<b>" + _("Height") + "</b> (cm)"
+        self.derived_labels = {
+            'wt_velocity': _("Weight velocity") + ' (g/' + _("week") + ')',
+            'ht_velocity': _("Height velocity") + ' (cm/' + _("month") + ')',
+            'bmi': _("BMI"),
+            'wfh': _("Weight-for-height") + ' (%)'}
+        # for the browser, with CLIENTSIDE_UNITS
+        self.labels = {'date': self.hover_date, 'age_d': self.hover_age_d,
+                       'age_y': self.hover_age_y, 'w_g': self.hover_w_g,
+                       'w_kg': self.hover_w_kg, 'h': self.hover_h,
+                       'axis_age_d': self.axis_age_d,
+                       'axis_age_y': self.axis_age_y,
+                       'axis_w_g': self.axis_w_g,
+                       'axis_w_kg': self.axis_w_kg,
+                       'derived': self.derived_labels}
+
+
+def initials(names):
+    """
+    Short names for the legend: the first letter of each name, or the
+    first two letters if an earlier name has the same first letter.
+    """
+    short = []
+    for name in names:
+        short.append(name[0] if name[0] not in short else name[0:2])
+    return short
+
+
+class Gottenso:
+    """
+    The data, caches and callbacks of one app, for one set of settings.
+    """
+
+    def __init__(self, settings):
+        import accesslog
+        import registry
+        import storage
+
+        self.settings = settings
+        if settings['REGISTRY']:
+            self.registry = registry.Registry.from_file(settings['REGISTRY'])
         else:
-            new_height = np.nan
-        if new_head:
-            new_head = float(new_head)
+            self.registry = registry.Registry.from_settings(settings)
+        self.datecol = settings['DATECOL']
+        self.agecol = settings['AGECOL']
+        self.weightcol = settings['WEIGHTCOL']
+        self.heightcol = settings['HEIGHTCOL']
+        self.headcol = settings['HEADCOL']
+        self.comcol = settings['COMCOL']
+        self.sd_wt_col = settings['SDWTCOL']
+        self.sd_ht_col = settings['SDHTCOL']
+        self.lms_wt_cols = settings['LMS_WT_COLS']
+        self.lms_ht_cols = settings['LMS_HT_COLS']
+        self.bands = growth_bands(settings['GROWTH_BANDS'])
+        self.language = settings['APPLANG']
+        self.max_points = settings['MAX_POINTS']
+        self.max_age_factor = float(settings['MAX_AGE'])
+        self.clientside_units = settings['CLIENTSIDE_UNITS']
+
+        # the default language first
+        languages = [self.language] + [
+            language for language in
+            settings['LANGUAGES'] or available_languages()
+            if language != self.language]
+        self.translations = {language: Translation(language)
+                             for language in languages}
+        self.match_language = lru_cache(maxsize=64)(self.best_language)
+
+        if settings['SHARED_REFERENCE']:
+            shared = self.registry.parent_keys() + ['gro']
         else:
-            new_head = np.nan
-        if new_comment:
-            new_comment = str(new_comment)
+            shared = ()
+        self.cache_size = settings['DATA_CACHE_SIZE']
+        if settings['STORAGE'] == 'sqlite':
+            self.store = storage.SqliteStorage(
+                settings['DBFILE'], self.agecol, shared, self.cache_size)
         else:
-            new_comment = np.nan
-        age = sel_date - child_birth
-        data_point = pd.DataFrame({
-            datecol: sel_date.isoformat(),
-            agecol: [age.days],
-            weightcol: [new_weight],
-            heightcol: [new_height],
-            headcol: [new_head],
-            comcol: [new_comment]})
-        c_data = c_data.append(data_point)
-        c_data.to_csv(cfile, index=False)
-    else:
-        pass
-    return clicks
-
-
-@app.callback(
-    Output('mainplot', 'figure'),
-    [Input('checkboxes', 'value'), Input('numclicks', 'children'),
-     Input('weightdrop', 'value'), Input('agedrop', 'value')])
-def update_figure(checkbox, num_clicks, weight_pref, age_pref,
-                  suppress_callback_exceptions=True):
-    p1 = p1name[0]
-    p2 = (p2name[0] if p2name[0] != p1 else p2name[0:2])
-    c0 = cname[0]
-    if age_pref == 'days':
-        hover_age = hover_age_d
-    else:
-        hover_age = hover_age_y
-    if weight_pref == 'g':
-        hover_w = hover_w_g
-    else:
-        hover_w = hover_w_kg
-
-    lenhover = hover_date + hover_age + \
-        ('<b>' + _("Height") + '</b>: %{y} cm <br>%{customdata}')
-
-    vikthover = hover_date + \
-        hover_age + hover_w
-
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    c_data = pd.read_csv(cfile)
-    c_data[comcol] = c_data[comcol].convert_dtypes()
-    if 'show_wt' in checkbox:
-        fig.add_trace(
-            go.Scatter(x=calc_age(c_data[agecol], age_pref),
-                       y=calc_weight(c_data[weightcol], weight_pref),
-                       name=c0 + " " + _("weight"),
-                       hovertemplate=vikthover,
-                       text=[dt.date.isoformat(child_birth + dt.timedelta(days=daze))
-                             for daze in c_data[agecol]], mode='lines+markers',
-                       connectgaps=True,
-                       customdata=[
-                '<br>' +
-                comment if str(comment) != '<NA>' else '' for comment in c_data[comcol]]
+            files = self.registry.files()
+            files['gro'] = settings['GROFILE']
+            self.store = storage.CsvStorage(
+                files, self.agecol, shared, reference_columns(settings),
+                self.cache_size, settings['JOURNAL_SIZE'])
+
+        self.access_log = accesslog.AccessLog(
+            settings['LOGFILE'], max_bytes=settings['LOG_MAX_BYTES'],
+            backups=settings['LOG_BACKUPS'])
+
+        self._hover_cache = OrderedDict()
+        self._score_cache = OrderedDict()
+        self._derived_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._version_tags = {}
+        self.poll_seconds = settings['POLL_SECONDS']
+        # for metrics.instrument, per app
+        self.profiling = {'slow_ms': settings['SLOW_CALLBACK_MS'],
+                          'profile_dir': settings['PROFILE_DIR']}
+        self.growth_references = lru_cache(maxsize=2)(self.make_references)
+        self.reference_bands = lru_cache(maxsize=16)(self.make_bands)
+        self.render_figure = lru_cache(
+            maxsize=settings['FIG_CACHE_SIZE'])(self.build_figure)
+        self.make_layout = lru_cache(maxsize=32)(self.build_layout)
+        self.downsampled_data = lru_cache(maxsize=32)(self.downsample_data)
+
+    def normalize_units(self, raw_data):
+        """Convert the weight / height of a dataframe to g/cm (in place)."""
+        return normalize_units(raw_data, self.settings)
+
+    def convert_comments(self, c_data):
+        """Make the comments of the child's data strings (in place)."""
+        c_data[self.comcol] = c_data[self.comcol].convert_dtypes()
+        return c_data
+
+    def hover_data(self, name, data, birth, comments=False):
+        """
+        Return the date strings (for the hover text) and, if comments is
+        set, the comments (for the hover customdata) of the points in data.
+
+        They are computed once per loaded version of the data, and shared
+        between the weight and height traces. Like the data, they are
+        kept for at most DATA_CACHE_SIZE data sets.
+        """
+        import numpy as np
+
+        cached = self._cached(self._hover_cache, name)
+        if cached is not None and cached[0] is data:
+            return cached[1]
+        days = data[self.agecol].to_numpy(
+            dtype='float64').astype('timedelta64[D]')
+        text = np.datetime_as_string(
+            np.datetime64(birth.date(), 'D') + days, unit='D')
+        if comments:
+            com_data = data[self.comcol].astype('string')
+            customdata = np.where(com_data.isna(), '',
+                                  '<br>' + com_data.fillna('')).astype(str)
+        else:
+            customdata = np.full(len(data), '')
+        self._remember(self._hover_cache, name, (data, (text, customdata)))
+        return text, customdata
+
+    def _cached(self, cache, key):
+        with self._cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _remember(self, cache, key, value):
+        # keep at most DATA_CACHE_SIZE entries, like the storage
+        with self._cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def make_references(self, version):
+        """
+        Return the growth references for weight and height ('wt', 'ht'),
+        from the L, M and S columns if the growth curve data has them, and
+        else from the mean and SD; None if there's no reference. 'wfh' is
+        the (heights, weights) of the average weight by height, sorted by
+        height. Cached per data version as growth_references.
+        """
+        import numpy as np
+        import growth
+
+        gro_data = self.reference_data('gro')
+        references = {}
+        for measure, col, sd_col, lms_cols in (
+                ('wt', self.weightcol, self.sd_wt_col, self.lms_wt_cols),
+                ('ht', self.heightcol, self.sd_ht_col, self.lms_ht_cols)):
+            if gro_data is None:
+                references[measure] = None
+            elif all(lms_col in gro_data for lms_col in lms_cols):
+                references[measure] = growth.Reference(
+                    gro_data[self.agecol],
+                    lms=[gro_data[lms_col] for lms_col in lms_cols])
+            elif col in gro_data and sd_col in gro_data:
+                references[measure] = growth.Reference(
+                    gro_data[self.agecol], gro_data[col], gro_data[sd_col])
+            else:
+                references[measure] = None
+        references['wfh'] = None
+        if gro_data is not None and self.heightcol in gro_data and \
+                self.weightcol in gro_data:
+            # the shared (mapped) columns, if they need no sorting
+            heights = gro_data[self.heightcol].to_numpy()
+            weights = gro_data[self.weightcol].to_numpy()
+            known = ~np.isnan(heights) & ~np.isnan(weights)
+            if not known.all():
+                heights, weights = heights[known], weights[known]
+            if len(heights):
+                references['wfh'] = tuple(growth.sorted_by(heights,
+                                                           weights))
+        return references
+
+    def make_bands(self, version, below, weight_pref, age_pref):
+        """
+        Return the growth curves to plot, for 'wt' and 'ht': the ages and
+        the average, and for each of the GROWTH_BANDS a label and the
+        closed polygon (x, y) around the band, all rounded to the
+        precision that shows; None for a measure the data doesn't have.
+        Cached per data version, range and units as reference_bands.
+        """
+        import numpy as np
+
+        gro_data = self.plot_data('gro', below=below)
+        references = self.growth_references(version)
+        ages = gro_data[self.agecol].to_numpy(dtype='float64')
+        x = rounded(calc_age(ages, age_pref), age_pref)
+        poly_x = np.concatenate([x, x[::-1]])
+        bands = {}
+        for measure, col, unit in (('wt', self.weightcol, weight_pref),
+                                   ('ht', self.heightcol, 'cm')):
+            if col not in gro_data:
+                bands[measure] = None
+                continue
+            # heights are plotted in cm as they are
+            scale = calc_weight if measure == 'wt' else \
+                (lambda values, unit: values)
+            mean = rounded(scale(gro_data[col].to_numpy(dtype='float64'),
+                                 unit), unit)
+            polygons = []
+            if references[measure] is not None:
+                for label, z in self.bands:
+                    upper, lower = (rounded(scale(
+                        references[measure].values(ages, sign * z), unit),
+                        unit) for sign in (1, -1))
+                    polygons.append((label, poly_x,
+                                     np.concatenate([upper, lower[::-1]])))
+            bands[measure] = (x, mean, polygons)
+        return bands
+
+    def child_scores(self, name, data, language=None):
+        """
+        Return the z-scores of the weights and heights of a child's data
+        against the growth curves (NaN where there's no reference), and
+        the hover texts for them in language (one per point, for weight
+        and height).
+
+        They are cached per version of the child's and the growth curve
+        data, and the texts per language. When rows have only been added
+        to the child's data, only the scores of the new rows are computed.
+        """
+        import numpy as np
+
+        language = language or self.language
+        gro_version = self.store.version('gro')
+        cached = self._cached(self._score_cache, name)
+        if cached is not None and cached[0] is data and \
+                cached[1] == gro_version:
+            scores, texts = cached[2], cached[3]
+            if language not in texts:
+                texts[language] = [self.score_text(z, language)
+                                   for z in scores]
+            return list(zip(scores, texts[language]))
+        references = self.growth_references(gro_version)
+        start = 0
+        if cached is not None and cached[1] == gro_version:
+            start = self.appended_rows(cached[0], data)
+        ages = data[self.agecol].to_numpy(dtype='float64')[start:]
+        new = []
+        for measure, col in (('wt', self.weightcol), ('ht', self.heightcol)):
+            reference = references[measure]
+            if reference is None or col not in data:
+                new.append(np.full(len(ages), np.nan))
+            else:
+                new.append(reference.z_scores(
+                    ages, data[col].to_numpy(dtype='float64')[start:]))
+        scores, texts = new, {}
+        if start:
+            scores = [np.concatenate([old_z, z])
+                      for old_z, z in zip(cached[2], new)]
+            # only the new rows of the texts already made
+            texts = {lang: [np.concatenate([old_text,
+                                            self.score_text(z, lang)])
+                            for old_text, z in zip(old_texts, new)]
+                     for lang, old_texts in cached[3].items()}
+        if language not in texts:
+            texts[language] = [self.score_text(z, language) for z in scores]
+        self._remember(self._score_cache, name,
+                       (data, gro_version, scores, texts))
+        return list(zip(scores, texts[language]))
+
+    def appended_rows(self, old, data):
+        """
+        Return the number of rows of data that are the same as in old
+        (all of old), if data only has rows added to it; else 0.
+        """
+        import numpy as np
+
+        cols = [self.agecol, self.weightcol, self.heightcol]
+        if len(old) <= len(data) and all(
+                np.array_equal(old[col].to_numpy(),
+                               data[col].to_numpy()[:len(old)],
+                               equal_nan=True)
+                for col in cols if col in old and col in data):
+            return len(old)
+        return 0
+
+    def derived_metrics(self, name, data, language=None):
+        """
+        Return the metrics derived from a child's data, as arrays with a
+        value per row (NaN where it can't be computed): the weight velocity
+        in g/week ('wt_velocity'), the height velocity in cm/month
+        ('ht_velocity'), the BMI ('bmi') and the weight as a percentage of
+        the average weight at the same height ('wfh'). 'wt_text' and
+        'ht_text' are their hover texts in language, for weight and height.
+
+        They are cached like the z-scores (see child_scores). When rows
+        have only been added, only the new rows are computed, from the
+        last measured weight and height before them.
+        """
+        import numpy as np
+        import growth
+
+        language = language or self.language
+        gro_version = self.store.version('gro')
+        cached = self._cached(self._derived_cache, name)
+        if cached is not None and cached[0] is data and \
+                cached[1] == gro_version:
+            values, texts = cached[2], cached[4]
+            if language not in texts:
+                texts[language] = self.derived_text(values, language)
+            return dict(values, **texts[language])
+        start = 0
+        if cached is not None and cached[1] == gro_version:
+            start = self.appended_rows(cached[0], data)
+        last = cached[3] if start else {}
+
+        def column(col):
+            if col not in data:
+                return np.full(len(data) - start, np.nan)
+            return data[col].to_numpy(dtype='float64')[start:]
+
+        ages = data[self.agecol].to_numpy(dtype='float64')[start:]
+        weights, heights = column(self.weightcol), column(self.heightcol)
+        new = {'wt_velocity': growth.velocity(ages, weights, 7,
+                                              last.get('wt')),
+               'ht_velocity': growth.velocity(ages, heights, 30.4375,
+                                              last.get('ht')),
+               'bmi': growth.bmi(weights, heights)}
+        wfh = self.growth_references(gro_version)['wfh']
+        if wfh is None:
+            new['wfh'] = np.full(len(ages), np.nan)
+        else:
+            new['wfh'] = growth.weight_for_height(weights, heights, *wfh)
+        values, texts = new, {}
+        if start:
+            values = {key: np.concatenate([cached[2][key], new[key]])
+                      for key in new}
+            # only the new rows of the texts already made
+            texts = {lang: {key: np.concatenate([old_texts[key], text])
+                            for key, text in self.derived_text(
+                                new, lang).items()}
+                     for lang, old_texts in cached[4].items()}
+        if language not in texts:
+            texts[language] = self.derived_text(values, language)
+        # the last measured weight and height, for the rows to come
+        last = dict(last)
+        for measure, measured in (('wt', weights), ('ht', heights)):
+            known = np.flatnonzero(~np.isnan(measured))
+            if known.size:
+                last[measure] = (ages[known[-1]], measured[known[-1]])
+        self._remember(self._derived_cache, name,
+                       (data, gro_version, values, last, texts))
+        return dict(values, **texts[language])
+
+    def derived_text(self, values, language):
+        """
+        The hover texts in language of derived metrics (see
+        derived_metrics), for weight ('wt_text') and height ('ht_text').
+        """
+        import numpy as np
+
+        _ = self.translations[language].gettext
+        return {
+            'wt_text': np.char.add(np.char.add(
+                labelled('<br><b>' + _("Velocity") + '</b>: ',
+                         values['wt_velocity'], '%+.0f', ' g/' + _("week")),
+                labelled('<br><b>' + _("BMI") + '</b>: ', values['bmi'],
+                         '%.1f')),
+                labelled('<br><b>' + _("Weight-for-height") + '</b>: ',
+                         values['wfh'], '%.0f', '%')),
+            'ht_text': labelled('<br><b>' + _("Velocity") + '</b>: ',
+                                values['ht_velocity'], '%+.1f',
+                                ' cm/' + _("month"))}
+
+    def score_text(self, z, language=None):
+        """
+        The hover texts in language of an array of z-scores ('' for NaN).
+        """
+        import growth
+        import numpy as np
+
+        _ = self.translations[language or self.language].gettext
+        if not len(z):
+            # np.char.mod gives floats for no values
+            return np.array([], dtype=str)
+        known = ~np.isnan(z)
+        filled = np.where(known, z, 0)
+        text = np.char.add(
+            np.char.add('<b>' + _("z-score") + '</b>: ',
+                        np.char.mod('%+.2f', filled)),
+            np.char.add(' (' + _("percentile") + ' ',
+                        np.char.add(np.char.mod('%.1f', np.clip(
+                            growth.percentiles(filled), 0.1, 99.9)), ')')))
+        return np.where(known, text, '')
+
+    def reference_data(self, name, below=None):
+        """
+        Return the data of a parent (see registry.py) or the growth curve
+        ('gro') data in g/cm, or None if it's not found. If below is given,
+        only the rows with an age below it are returned.
+
+        The storage checks the file's identity on every call, so a changed
+        file is reloaded (and only that file) without restarting the server.
+        """
+        return self.store.read(name, self.normalize_units, below=below)
+
+    def plot_data(self, name, below=None):
+        """
+        Return the reference data to plot. Like reference_data, but long
+        tables are downsampled to about MAX_POINTS points per curve over
+        the plotted age range (reference_data keeps the full resolution).
+        """
+        data = self.reference_data(name, below=below)
+        if not self.max_points or data is None or \
+                len(data) <= self.max_points:
+            return data
+        return self.downsampled_data(name, self.store.version(name), below)
+
+    def downsample_data(self, name, version, below):
+        """
+        Downsampled reference data; cached per data version and range
+        as downsampled_data.
+        """
+        import growth
+
+        data = self.reference_data(name, below=below)
+        keep = growth.downsample(
+            data[self.agecol], [data[col] for col in (self.weightcol,
+                                                      self.heightcol)
+                                if col in data],
+            self.max_points)
+        return data.iloc[keep]
+
+    def current_user(self):
+        """The logged in user, or None outside of a request."""
+        from flask import has_request_context, request
+
+        if has_request_context() and request.authorization:
+            return request.authorization['username']
+        return None
+
+    def current_family(self):
+        return self.registry.family(self.current_user())
+
+    def best_language(self, accept_language):
+        """
+        The language of the app that best matches an Accept-Language
+        header, or the default one. Cached per header as match_language.
+        """
+        from werkzeug.datastructures import LanguageAccept
+        from werkzeug.http import parse_accept_header
+
+        tags = {}
+        for language in self.translations:
+            for tag in (language,) + LANGUAGE_ALIASES.get(language, ()):
+                tags.setdefault(tag, language)
+        accepted = parse_accept_header(accept_language, LanguageAccept)
+        return tags.get(accepted.best_match(tags), self.language)
+
+    def current_language(self):
+        """
+        The language of the current request: the user's language in the
+        registry if it has one, else the best match for the browser's
+        Accept-Language. Outside of a request, the default language.
+        """
+        from flask import has_request_context, request
+
+        if not has_request_context():
+            return self.language
+        user = self.registry.users.get(self.current_user())
+        if user is not None and user.language in self.translations:
+            return user.language
+        return self.match_language(request.headers.get('Accept-Language',
+                                                       ''))
+
+    def serve_layout(self):
+        """
+        Return the layout for a page load, in the user's language. The
+        checklist labels show which reference data is found, so they are
+        checked for every page load.
+        """
+        import numpy as np
+
+        family = self.current_family()
+        names = ['gro'] + [parent.key for parent in family.parents]
+        return self.make_layout(family.name, tuple(
+            bool(np.any(self.reference_data(name))) for name in names),
+            self.current_language())
+
+    def build_layout(self, family_name, found, language):
+        """
+        Build the layout of a family in a language; found tells if the gro
+        data and the data of each parent exists. Cached per family,
+        combination and language as make_layout.
+        """
+        import dash_core_components as dcc
+        import dash_html_components as html
+
+        texts = self.translations[language]
+        _ = texts.gettext
+        family = self.registry.families[family_name]
+        gro_found = found[0]
+        cname = ', '.join(child.name for child in family.children)
+        parent_options = [
+            {'label': _("Plot") + ' ' + parent.name + ' ' +
+             _("for comparison") + (
+                _(' (ERROR: not found!)')
+                if not parent_found else ''),
+             'value': 'showp%d' % (i + 1)}
+            for i, (parent, parent_found) in enumerate(
+                zip(family.parents, found[1:]))]
+        return html.Div(children=[
+            dcc.Graph(
+                id='mainplot'
             ),
-            secondary_y=False,
-        )
-    if 'show_ht' in checkbox:
-        fig.add_trace(
-            go.Scatter(x=calc_age(c_data[agecol], age_pref), y=c_data[heightcol],
-                       name=c0 + " " + _("height"),
-                       hovertemplate=lenhover,
-                       text=[dt.date.isoformat(child_birth + dt.timedelta(days=daze))
-                             for daze in c_data[agecol]], mode='lines+markers',
-                       customdata=[
-                '<br>' +
-                comment if str(comment) != '<NA>' else '' for comment in c_data[comcol]],
-                connectgaps=True),
-            secondary_y=True,
-        )
+            html.Div(children=[
+                dcc.Checklist(
+                    id='checkboxes',
+                    options=[
+                        {'label': _("Plot") + ' ' + _("weight"),
+                         'value': 'show_wt'},
+                        {'label': _("Plot") + ' ' + _("height"),
+                         'value': 'show_ht'},
+                        {'label': _("Plot") + ' ' + _("growth curves") + (
+                            _(' (ERROR: not found!)')
+                            if not gro_found else ''),
+                         'value': 'gro_curves'}] + parent_options + [
+                        {'label': _("Zoom in around") + ' ' + cname,
+                         'value': 'zoom'}],
+                    value=['show_ht', 'show_wt', 'showp1', 'showp2', 'zoom'],
+                    style={'width': '290px'}
+                )], style={'columns': 2, 'margin-right': 'auto',
+                           'margin-left': 'auto', 'width': '600px'}),
+            # siblings are plotted together; hidden for an only child
+            html.Div(children=[
+                dcc.Checklist(
+                    id='children',
+                    options=[{'label': child.name, 'value': child.key}
+                             for child in family.children],
+                    value=[child.key for child in family.children],
+                    labelStyle={'display': 'inline-block'})
+            ], style={'margin-right': 'auto', 'margin-left': 'auto',
+                      'width': '600px',
+                      'display': 'block' if len(family.children) > 1
+                      else 'none'}),
+            html.Div(children=[
+                html.Label(_("Weight scale:"),
+                           style={'display': 'inline-block'}),
+                html.Div(style={'display': 'inline-block', 'width': '10px'}),
+                dcc.Dropdown(id='weightdrop',
+                             options=[{'label': _('Grams'), 'value': 'g'},
+                                      {'label': _('Kilograms'),
+                                       'value': 'kg'}],
+                             value='g',
+                             style={'width': '100px',
+                                    'display': 'inline-block',
+                                    'top': '15px'}),
+                html.Div(),
+                html.Label(_("Age scale:"), style={'display': 'inline-block'}),
+                html.Div(style={'display': 'inline-block', 'width': '10px'}),
+                dcc.Dropdown(id='agedrop',
+                             options=[{'label': _('Days'), 'value': 'days'},
+                                      {'label': _('Years'), 'value': 'years'}],
+                             value='days',
+                             style={'width': '100px',
+                                    'display': 'inline-block',
+                                    'top': '15px'}),
+                html.Div(),
+                html.Label(_("Also plot:"), style={'display': 'inline-block'}),
+                html.Div(style={'display': 'inline-block', 'width': '10px'}),
+                dcc.Dropdown(id='derivedrop',
+                             options=[{'label': label, 'value': metric}
+                                      for metric, label
+                                      in texts.derived_labels.items()],
+                             value=None,
+                             style={'width': '200px',
+                                    'display': 'inline-block',
+                                    'top': '15px'})
+            ], style={'columns': 2, 'margin-right': 'auto',
+                      'margin-left': 'auto', 'width': '600px'}),
+            html.Div(id='input-form'),
+            html.Div(id='numclicks', style={'display': 'none'}, children=0),
+            html.Div(id='numchanges', style={'display': 'none'}, children=0),
+            dcc.Store(id='figure-store'),
+            # polls /version, and clicks the hidden refresh button when
+            # the data has changed
+            dcc.Interval(id='poll', interval=self.poll_seconds * 1000,
+                         disabled=not self.poll_seconds),
+            html.Button(id='refresh', n_clicks=0, style={'display': 'none'}),
+            html.Div(id='poll-status', style={'display': 'none'})
+        ])
 
-    if 'gro_curves' in checkbox and np.any(gro_raw_data):
-        if 'zoom' in checkbox:
-            gro_data = gro_raw_data.loc[gro_raw_data[agecol]
-                                        < max_age_factor * max(c_data[agecol])]
+    def make_inputs(self, check):
+        import dash_core_components as dcc
+        import dash_html_components as html
+        from flask import request
+
+        _ = self.translations[self.current_language()].gettext
+        usr = request.authorization['username']
+        self.access_log.log('Connection by ' + usr)
+        if self.registry.is_parent(usr):
+            children = self.registry.family(usr).children
+            child_birth = min(child.birth for child in children)
+            input_form = html.Div(children=[
+                dcc.Markdown('##### ' + _("Add data point") + ':\n\n'),
+                dcc.Dropdown(
+                    id='setchild',
+                    options=[{'label': child.name, 'value': child.key}
+                             for child in children],
+                    value=children[0].key,
+                    clearable=False,
+                    style={'width': '150px',
+                           'display': 'inline-block'
+                           if len(children) > 1 else 'none'}),
+                dcc.DatePickerSingle(
+                    id='setdate',
+                    min_date_allowed=child_birth,
+                    max_date_allowed=child_birth + dt.timedelta(weeks=5200),
+                    initial_visible_month=dt.date.today(),
+                    date=dt.date.today(),
+                    style={'display': 'inline-block'}),
+                html.Div(style={'display': 'inline-block', 'width': '10px'}),
+                html.Label(_('Weight') + ' (g):',
+                           style={'display': 'inline-block'}),
+                html.Div(style={'display': 'inline-block', 'width': '5px'}),
+                dcc.Input(
+                    id='new_weight',
+                    style={
+                        'display': 'inline-block',
+                        'width': '100px'}),
+                html.Div(style={'display': 'inline-block', 'width': '10px'}),
+                html.Label(_('Height') + ' (cm):',
+                           style={'display': 'inline-block'}),
+                html.Div(style={'display': 'inline-block', 'width': '5px'}),
+                dcc.Input(
+                    id='new_height',
+                    style={
+                        'display': 'inline-block',
+                        'width': '100px'}),
+                html.Div(style={'display': 'inline-block', 'width': '10px'}),
+                html.Label(_('Head circumference') + ' (cm):', style={
+                           'display': 'inline-block'}),
+                html.Div(style={'display': 'inline-block', 'width': '5px'}),
+                dcc.Input(
+                    id='new_head',
+                    style={
+                        'display': 'inline-block',
+                        'width': '100px'}),
+                html.Div(style={'display': 'inline-block', 'width': '10px'}),
+                html.Label(_('Comment') + ':',
+                           style={'display': 'inline-block'}),
+                html.Div(style={'display': 'inline-block', 'width': '5px'}),
+                dcc.Input(
+                    id='new_comment',
+                    style={
+                        'display': 'inline-block',
+                        'width': '150px'}),
+                html.Div(style={'display': 'inline-block', 'width': '10px'}),
+                html.Button(
+                    _("Submit"),
+                    id='submit-button',
+                    n_clicks=0,
+                    style={
+                        'display': 'inline-block'}),
+                html.Button(
+                    _("Update"),
+                    id='edit-button',
+                    n_clicks=0,
+                    title=_("Change the data point of the date"),
+                    style={
+                        'display': 'inline-block'}),
+                html.Button(
+                    _("Delete"),
+                    id='delete-button',
+                    n_clicks=0,
+                    title=_("Delete the data point of the date"),
+                    style={
+                        'display': 'inline-block'})
+            ], style={'margin-right': 'auto',
+                      'margin-left': 'auto', 'max-width': '1100px'})
         else:
-            gro_data = gro_raw_data
-
-        if 'show_wt' in checkbox:
-            fig.add_trace(
-                go.Scatter(
-                    x=calc_age(
-                        gro_data[agecol],
-                        age_pref),
-                    y=calc_weight(
-                        gro_data[weightcol],
-                        weight_pref),
-                    name=_("Average weight"),
-                    connectgaps=True,
-                    line={
-                        'color': 'black'},
-                    mode='lines',
-                    hovertemplate=''),
-                secondary_y=False)
-
-            fig.add_trace(
-                go.Scatter(
-                    x=calc_age(
-                        gro_data[agecol],
-                        age_pref),
-                    y=calc_weight(
-                        (gro_data[weightcol] + gro_data[sd_wt_col]),
-                        weight_pref),
-                    name=_("Average weight") + " + 1 SD",
-                    showlegend=False,
-                    fill='tonexty',
-                    mode='none',
-                    hoveron='points+fills',
-                    hovertemplate=_("Average weight") + ' + 1 SD',
-                    line={
-                        'color': '#CCCCCC'},
-                    connectgaps=True),
-                secondary_y=False)
-
-            fig.add_trace(
-                go.Scatter(
-                    x=calc_age(
-                        gro_data[agecol],
-                        age_pref),
-                    y=calc_weight(
-                        (gro_data[weightcol] - gro_data[sd_wt_col]),
-                        weight_pref),
-                    name=_("Average weight") + ' - 1 SD',
-                    showlegend=False,
-                    fill='tonexty',
-                    mode='none',
-                    hoveron='points+fills',
-                    hovertemplate=_("Average weight") + ' - 1 SD',
-                    line={
-                        'color': '#CCCCCC'},
-                    connectgaps=True),
-                secondary_y=False)
-        if 'show_ht' in checkbox:
-            fig.add_trace(
-                go.Scatter(
-                    x=calc_age(
-                        gro_data[agecol],
-                        age_pref),
-                    y=gro_data[heightcol],
-                    name=_("Average height"),
-                    connectgaps=True,
-                    mode='lines',
-                    hovertemplate=''),
-                secondary_y=True)
-
-            fig.add_trace(
-                go.Scatter(
-                    x=calc_age(
-                        gro_data[agecol],
-                        age_pref),
-                    y=(
-                        gro_data[heightcol] +
-                        gro_data[sd_ht_col]),
-                    name=_("Average height") +
-                    ' + 1 SD',
-                    showlegend=False,
-                    fill='tonexty',
-                    mode='none',
-                    hoveron='points+fills',
-                    hovertemplate=_("Average height") +
-                    ' + 1 SD',
-                    line={
-                        'color': '#CCCCCC'},
-                    connectgaps=True),
-                secondary_y=True)
-
-            fig.add_trace(
-                go.Scatter(
-                    x=calc_age(
-                        gro_data[agecol],
-                        age_pref),
-                    y=(
-                        gro_data[heightcol] -
-                        gro_data[sd_ht_col]),
-                    name=_("Average height") +
-                    ' - 1 SD',
-                    showlegend=False,
-                    fill='tonexty',
-                    mode='none',
-                    hoveron='points+fills',
-                    hovertemplate=_("Average height") +
-                    ' + 1 SD',
-                    line={
-                        'color': '#CCCCCC'},
-                    connectgaps=True),
-                secondary_y=True)
-
-    if 'showp1' in checkbox and np.any(p1_raw_data):
-        if 'zoom' in checkbox:
-            p1_data = p1_raw_data.loc[p1_raw_data[agecol]
-                                      < max_age_factor * max(c_data[agecol])]
+            input_form = ''
+        return input_form
+
+    def new_datapoint(self, clicks, old_clicks, sel_date, new_weight,
+                      new_height, new_head, new_comment, child_key=None,
+                      suppress_callback_exceptions=True):
+        import numpy as np
+
+        old_clicks = int(old_clicks)
+
+        if clicks != old_clicks:
+            child = self.parents_child(child_key)
+            sel_date = dt.date.fromisoformat(sel_date)
+            age = sel_date - child.birth.date()
+            row = {self.datecol: sel_date.isoformat(),
+                   self.agecol: age.days,
+                   self.weightcol: np.nan,
+                   self.heightcol: np.nan,
+                   self.headcol: np.nan,
+                   self.comcol: np.nan}
+            row.update(self.datapoint_values(new_weight, new_height,
+                                             new_head, new_comment))
+            self.store.append(child.key, row)
+        else:
+            pass
+        return clicks
+
+    def parents_child(self, child_key=None):
+        """
+        Return the child (the first one if child_key isn't given) whose
+        data the current user may change, or raise PreventUpdate if the
+        user isn't a parent of it.
+        """
+        from dash.exceptions import PreventUpdate
+
+        usr = self.current_user()
+        if usr is not None and not self.registry.is_parent(usr):
+            raise PreventUpdate
+        children = self.registry.family(usr).children
+        child = children[0] if child_key is None else next(
+            (child for child in children if child.key == child_key), None)
+        if child is None:
+            raise PreventUpdate
+        return child
+
+    def datapoint_values(self, new_weight, new_height, new_head,
+                         new_comment):
+        """The column -> value of the fields filled in in the form."""
+        values = {}
+        if new_weight:
+            values[self.weightcol] = int(new_weight)
+        if new_height:
+            values[self.heightcol] = float(new_height)
+        if new_head:
+            values[self.headcol] = float(new_head)
+        if new_comment:
+            values[self.comcol] = str(new_comment)
+        return values
+
+    def change_datapoint(self, edit_clicks, delete_clicks, changes, sel_date,
+                         new_weight, new_height, new_head, new_comment,
+                         child_key=None, suppress_callback_exceptions=True):
+        """
+        Update (with the fields filled in) or delete the data point of
+        the selected date, for the Update / Delete buttons. Returns the
+        number of changes made, to redraw the figure.
+        """
+        from dash import callback_context
+        from dash.exceptions import PreventUpdate
+
+        # callback_context.triggered_id is only in Dash 2.4+
+        button = callback_context.triggered[0]['prop_id'].split('.')[0]
+        if button == 'edit-button' and edit_clicks:
+            values = self.datapoint_values(new_weight, new_height, new_head,
+                                           new_comment)
+            changed = values and self.edit_datapoint(sel_date, values,
+                                                     child_key)
+        elif button == 'delete-button' and delete_clicks:
+            changed = self.delete_datapoint(sel_date, child_key)
+        else:
+            changed = False
+        if not changed:
+            raise PreventUpdate
+        return int(changes or 0) + 1
+
+    def edit_datapoint(self, sel_date, values, child_key=None):
+        """
+        Set the values (column -> value) of the child's data point of the
+        date sel_date (an ISO date string). Returns False if there's none.
+        """
+        child = self.parents_child(child_key)
+        age = (dt.date.fromisoformat(sel_date) - child.birth.date()).days
+        if age not in self.store.index(child.key):
+            return False
+        self.store.edit(child.key, age, values)
+        return True
+
+    def delete_datapoint(self, sel_date, child_key=None):
+        """
+        Delete the child's data point of the date sel_date (an ISO date
+        string). Returns False if there's none.
+        """
+        child = self.parents_child(child_key)
+        age = (dt.date.fromisoformat(sel_date) - child.birth.date()).days
+        if age not in self.store.index(child.key):
+            return False
+        self.store.delete(child.key, age)
+        return True
+
+    def data_version(self, family=None):
+        """Identify the current version of all the data files of a family."""
+        family = family or self.registry.family()
+        return tuple(self.store.version(person.key)
+                     for person in family.children + family.parents) + \
+            (self.store.version('gro'),)
+
+    def selected_children(self, family, children):
+        """
+        The keys of the family's children among children (all of them if
+        it's None), so that a user only ever sees their own family.
+        """
+        return tuple(child.key for child in family.children
+                     if children is None or child.key in children)
+
+    def zoom_limit(self, family, children):
+        """The age to zoom in to, for the given children (or None)."""
+        ages = [max(data[self.agecol]) for data in
+                (self.store.read(child.key, self.convert_comments)
+                 for child in family.children if child.key in children)
+                if data is not None and len(data)]
+        return self.max_age_factor * max(ages) if ages else None
+
+    def update_figure(self, checkbox, num_clicks, weight_pref, age_pref,
+                      children=None, num_changes=None, refreshes=None,
+                      derived=None, suppress_callback_exceptions=True):
+        family = self.current_family()
+        figure = self.render_figure(
+            tuple(sorted(checkbox)), weight_pref, age_pref, family.name,
+            self.selected_children(family, children),
+            self.data_version(family), self.current_language(),
+            (derived,) if derived else ())
+        metrics.observe('gottenso_payload_bytes', len(figure),
+                        buckets=metrics.SIZE_BUCKETS,
+                        callback='update_figure')
+        return json.loads(figure)
+
+    def update_figure_data(self, num_clicks, children=None,
+                           num_changes=None, refreshes=None):
+        """
+        With CLIENTSIDE_UNITS, send every trace in g and days along with
+        the labels for the other units, and let the browser pick the
+        traces and scale them (see assets/clientside.js).
+        """
+        family = self.current_family()
+        children = self.selected_children(family, children)
+        texts = self.translations[self.current_language()]
+        all_checks = ('gro_curves', 'show_ht', 'show_wt', 'showp1', 'showp2')
+        figure = self.render_figure(all_checks, 'g', 'days', family.name,
+                                    children, self.data_version(family),
+                                    texts.language,
+                                    tuple(texts.derived_labels))
+        return {
+            'figure': json.loads(figure),
+            'limit': self.zoom_limit(family, children),
+            'labels': texts.labels}
+
+    def build_figure(self, checkbox, weight_pref, age_pref, family_name,
+                     children, version, language, derived=()):
+        """
+        Build the figure of the given children (keys) of a family and
+        return it as JSON. The derived metrics given (see
+        derived_metrics) are plotted on a third y axis.
+
+        The results are kept in a bounded LRU cache as render_figure;
+        version is only part of the cache key, so that a changed data file
+        gives a new figure; the texts are in language. Hits and misses
+        are counted by render_figure.cache_info().
+        """
+        import numpy as np
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
+        start = time.perf_counter()
+        texts = self.translations[language]
+        _ = texts.gettext
+        agecol, weightcol, heightcol = \
+            self.agecol, self.weightcol, self.heightcol
+        family = self.registry.families[family_name]
+        kids = [child for child in family.children if child.key in children]
+        if age_pref == 'days':
+            hover_age = texts.hover_age_d
         else:
-            p1_data = p1_raw_data
-
-        if 'show_wt' in checkbox:
-            fig.add_trace(
-                go.Scatter(
-                    x=calc_age(
-                        p1_data[agecol],
-                        age_pref),
-                    y=calc_weight(
-                        p1_data[weightcol],
-                        weight_pref),
-                    name=p1 +
-                    " " +
-                    _("weight"),
-                    connectgaps=True,
-                    hovertemplate=vikthover,
-                    text=[
-                        dt.date.isoformat(
-                            h_birth +
-                            dt.timedelta(
-                                days=daze)) for daze in p1_data[agecol]],
-                    customdata=[
-                        '' for i in p1_data[agecol]],
-                    mode='lines+markers'),
-                secondary_y=False,
-            )
-        if 'show_ht' in checkbox:
-            fig.add_trace(
-                go.Scatter(
-                    x=calc_age(
-                        p1_data[agecol],
-                        age_pref),
-                    y=p1_data[heightcol],
-                    name=p1 +
-                    " " +
-                    _("height"),
-                    connectgaps=True,
-                    hovertemplate=lenhover,
-                    text=[
-                        dt.date.isoformat(
-                            h_birth +
-                            dt.timedelta(
-                                days=daze)) for daze in p1_data[agecol]],
-                    mode='lines+markers',
-                    customdata=[
-                        '' for i in p1_data[agecol]]),
-                secondary_y=True,
-            )
-
-    if 'showp2' in checkbox and np.any(p2_raw_data):
+            hover_age = texts.hover_age_y
+        if weight_pref == 'g':
+            hover_w = texts.hover_w_g
+        else:
+            hover_w = texts.hover_w_kg
+
+        lenhover = texts.hover_date + hover_age + texts.hover_h
+
+        vikthover = texts.hover_date + \
+            hover_age + hover_w
+
+        fig = make_subplots(specs=[[{"secondary_y": True}]])
+        for child, c0 in zip(kids, initials([kid.name for kid in kids])):
+            c_data = self.store.read(child.key, self.convert_comments)
+            if c_data is None:
+                continue
+            c_text, c_custom = self.hover_data(child.key, c_data,
+                                               child.birth, comments=True)
+            (z_wt, wt_text), (z_ht, ht_text) = self.child_scores(
+                child.key, c_data, language)
+            c_derived = self.derived_metrics(child.key, c_data, language)
+            wt_text = np.char.add(wt_text, c_derived['wt_text'])
+            ht_text = np.char.add(ht_text, c_derived['ht_text'])
+            if 'show_wt' in checkbox:
+                fig.add_trace(
+                    go.Scatter(x=calc_age(c_data[agecol], age_pref),
+                               meta=['child', 'wt'],
+                               y=calc_weight(c_data[weightcol], weight_pref),
+                               name=c0 + " " + _("weight"),
+                               hovertemplate=vikthover,
+                               text=c_text, mode='lines+markers',
+                               connectgaps=True,
+                               customdata=np.char.add(wt_text, c_custom)
+                               ),
+                    secondary_y=False,
+                )
+            if 'show_ht' in checkbox:
+                fig.add_trace(
+                    go.Scatter(x=calc_age(c_data[agecol], age_pref),
+                               y=c_data[heightcol],
+                               meta=['child', 'ht'],
+                               name=c0 + " " + _("height"),
+                               hovertemplate=lenhover,
+                               text=c_text, mode='lines+markers',
+                               customdata=np.char.add(ht_text, c_custom),
+                               connectgaps=True),
+                    secondary_y=True,
+                )
+            for metric in derived:
+                label = texts.derived_labels[metric]
+                fig.add_trace(
+                    go.Scatter(x=calc_age(c_data[agecol], age_pref),
+                               y=c_derived[metric],
+                               meta=['child', metric],
+                               name=c0 + " " + label,
+                               yaxis='y3',
+                               hovertemplate=texts.hover_date + hover_age +
+                               '<b>' + label + '</b>: %{y:.1f}',
+                               text=c_text, mode='lines+markers',
+                               line={'dash': 'dot'},
+                               connectgaps=True))
+
         if 'zoom' in checkbox:
-            p2_data = p2_raw_data.loc[p2_raw_data[agecol]
-                                      < max_age_factor * max(c_data[agecol])]
+            below = self.zoom_limit(family, children)
         else:
-            p2_data = p2_raw_data
-        if 'show_wt' in checkbox:
-            fig.add_trace(
-                go.Scatter(
-                    x=calc_age(
-                        p2_data[agecol],
-                        age_pref),
-                    y=calc_weight(
-                        p2_data[weightcol],
-                        weight_pref),
-                    name=p2 +
-                    " " +
-                    _("weight"),
-                    connectgaps=True,
-                    hovertemplate=vikthover,
-                    text=[
-                        dt.date.isoformat(
-                            l_birth +
-                            dt.timedelta(
-                                days=daze)) for daze in p2_data[agecol]],
-                    customdata=[
-                        '' for i in p2_data[agecol]],
-                    mode='lines+markers'),
-                secondary_y=False,
-            )
-        if 'show_ht' in checkbox:
-            fig.add_trace(
-                go.Scatter(
-                    x=calc_age(
-                        p2_data[agecol],
-                        age_pref),
-                    y=p2_data[heightcol],
-                    name=p2 +
-                    " " +
-                    _("height"),
-                    connectgaps=True,
-                    hovertemplate=lenhover,
-                    text=[
-                        dt.date.isoformat(
-                            l_birth +
-                            dt.timedelta(
-                                days=daze)) for daze in p2_data[agecol]],
-                    mode='lines+markers',
-                    customdata=[
-                        '' for i in p2_data[agecol]]),
-                secondary_y=True,
-            )
-    fig.update_layout(
-        title_text=(cname + _("'s development"))
-    )
-    if age_pref == 'days':
-        fig.update_xaxes(
-            title_text=(
-                "<b>" +
-                _("Age") +
-                "</b> (" +
-                _("days") +
-                ")"))
-    else:
-        fig.update_xaxes(
-            title_text=(
-                "<b>" + _("Age") + "</b> (" + _("years") + ")"))
-    if weight_pref == 'g':
-        fig.update_yaxes(
-            title_text=(
-                "<b>" + _("Weight") + "</b> (g)"),
-            secondary_y=False)
-    else:
-        fig.update_yaxes(
-            title_text=(
-                "<b>" + _("Weight") + "</b> (kg)"),
-            secondary_y=False)
-    fig.update_yaxes(
-        title_text=(
-            "<b>" + _("Height") + "</b> (cm)"),
-        secondary_y=True)
-    fig.update_layout(transition_duration=500)
-    return fig
+            below = None
+
+        if 'gro_curves' in checkbox and np.any(self.reference_data('gro')):
+            bands = self.reference_bands(self.store.version('gro'), below,
+                                         weight_pref, age_pref)
+            for measure, name, line in (
+                    ('wt', _("Average weight"), {'color': 'black'}),
+                    ('ht', _("Average height"), None)):
+                if 'show_' + measure not in checkbox or \
+                        bands[measure] is None:
+                    continue
+                x, mean, polygons = bands[measure]
+                # the widest band first, so that the narrower ones and
+                # the average are drawn on top of it
+                for label, poly_x, poly_y in polygons:
+                    fig.add_trace(
+                        go.Scatter(
+                            meta=['gro', measure],
+                            x=poly_x,
+                            y=poly_y,
+                            name=name + ' ' + label,
+                            showlegend=False,
+                            fill='toself',
+                            mode='none',
+                            hoveron='fills',
+                            line={
+                                'color': '#CCCCCC'}),
+                        secondary_y=measure == 'ht')
+                fig.add_trace(
+                    go.Scatter(
+                        meta=['gro', measure],
+                        x=x,
+                        y=mean,
+                        name=name,
+                        connectgaps=True,
+                        line=line,
+                        mode='lines',
+                        hovertemplate=''),
+                    secondary_y=measure == 'ht')
+
+        parent_names = initials([parent.name for parent in family.parents])
+        for i, (parent, p0) in enumerate(zip(family.parents, parent_names)):
+            series = 'p%d' % (i + 1)
+            if 'show' + series not in checkbox or \
+                    not np.any(self.reference_data(parent.key)):
+                continue
+            p_data = self.plot_data(parent.key, below=below)
+            p_text, p_custom = self.hover_data(parent.key, p_data,
+                                               parent.birth)
+
+            if 'show_wt' in checkbox:
+                fig.add_trace(
+                    go.Scatter(
+                        meta=[series, 'wt'],
+                        x=calc_age(
+                            p_data[agecol],
+                            age_pref),
+                        y=calc_weight(
+                            p_data[weightcol],
+                            weight_pref),
+                        name=p0 +
+                        " " +
+                        _("weight"),
+                        connectgaps=True,
+                        hovertemplate=vikthover,
+                        text=p_text,
+                        customdata=p_custom,
+                        mode='lines+markers'),
+                    secondary_y=False,
+                )
+            if 'show_ht' in checkbox:
+                fig.add_trace(
+                    go.Scatter(
+                        meta=[series, 'ht'],
+                        x=calc_age(
+                            p_data[agecol],
+                            age_pref),
+                        y=p_data[heightcol],
+                        name=p0 +
+                        " " +
+                        _("height"),
+                        connectgaps=True,
+                        hovertemplate=lenhover,
+                        text=p_text,
+                        mode='lines+markers',
+                        customdata=p_custom),
+                    secondary_y=True,
+                )
+        fig.update_layout(
+            title_text=(', '.join(kid.name for kid in kids) +
+                        _("'s development"))
+        )
+        if age_pref == 'days':
+            fig.update_xaxes(title_text=texts.axis_age_d)
+        else:
+            fig.update_xaxes(title_text=texts.axis_age_y)
+        if weight_pref == 'g':
+            fig.update_yaxes(title_text=texts.axis_w_g, secondary_y=False)
+        else:
+            fig.update_yaxes(title_text=texts.axis_w_kg, secondary_y=False)
+        fig.update_yaxes(title_text=texts.axis_h, secondary_y=True)
+        if derived:
+            fig.update_layout(
+                xaxis={'domain': [0, 0.9]},
+                yaxis3={'title': {'text': '<b>' + texts.derived_labels[
+                    derived[0]] + '</b>' if len(derived) == 1 else ''},
+                        'overlaying': 'y', 'side': 'right',
+                        'anchor': 'free', 'position': 1,
+                        'showgrid': False})
+        fig.update_layout(transition_duration=500)
+        metrics.observe('gottenso_stage_seconds', time.perf_counter() - start,
+                        stage='traces')
+        with metrics.timer('serialize'):
+            return fig.to_json()
+
+    def figure_cache_metrics(self):
+        info = self.render_figure.cache_info()
+        return [('gottenso_cache_total',
+                 {'cache': 'figure', 'result': 'hit'}, info.hits),
+                ('gottenso_cache_total',
+                 {'cache': 'figure', 'result': 'miss'}, info.misses)]
+
+    def login(self, role=None):
+        """
+        The username of the request's login, if it's valid (and has the
+        given role).
+        """
+        from flask import request
+
+        auth = request.authorization
+        user = self.registry.users.get(auth.username) if auth else None
+        if user is None or auth.password != user.password or \
+                role not in (None, user.role):
+            return None
+        return auth.username
+
+    def parent_login(self):
+        """The username of the request's login, if it's a parent."""
+        return self.login('parent')
+
+    def version_tag(self, family):
+        """
+        A short tag of the current version of a family's data, the same in
+        every worker. It's kept for a second, so that polls from many open
+        dashboards are answered from memory.
+        """
+        import hashlib
+
+        now = time.monotonic()
+        cached = self._version_tags.get(family.name)
+        if cached is not None and now - cached[0] < 1:
+            return cached[1]
+        tag = hashlib.blake2b(repr(self.data_version(family)).encode(),
+                              digest_size=8).hexdigest()
+        self._version_tags[family.name] = (now, tag)
+        return tag
+
+    def version_page(self):
+        """
+        The version tag of the user's family's data, with it as the
+        ETag, so that an unchanged version is a bodiless 304 response.
+        Polled by the dashboards (see assets/clientside.js).
+        """
+        from flask import request, Response
+
+        usr = self.login()
+        if usr is None:
+            return Response('Login required', 401,
+                            {'WWW-Authenticate': 'Basic realm="version"'})
+        tag = self.version_tag(self.registry.family(usr))
+        if tag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(tag, mimetype='text/plain')
+        response.set_etag(tag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def metrics_page(self):
+        """Metrics in the Prometheus text format, for the parent login."""
+        from flask import Response
+
+        if self.parent_login() is None:
+            return Response('Login required', 401,
+                            {'WWW-Authenticate': 'Basic realm="metrics"'})
+        return Response(metrics.render([self.figure_cache_metrics]),
+                        mimetype='text/plain; version=0.0.4')
+
+    def import_data(self, source, filename='', child_key=None, mapping=None,
+                    usr=None):
+        """
+        Import a .csv or .json export (see importer.py) for a child of
+        usr's family (the first one if child_key isn't given). Returns the
+        number of rows added and skipped, or None if there's no such
+        child.
+        """
+        import importer
+
+        children = self.registry.family(usr).children
+        child = children[0] if child_key is None else next(
+            (child for child in children if child.key == child_key), None)
+        if child is None:
+            return None
+        counts = importer.import_export(
+            self.store, child.key, child.birth, source, self.settings,
+            filename, mapping)
+        self.access_log.log('%s imported %d rows for %s' % (
+            usr or 'parent', counts['added'], child.name))
+        return counts
+
+    def import_page(self):
+        """
+        Import an export uploaded (as the form field 'file') by a parent.
+        The form fields 'child' and 'columns' (a JSON object of data file
+        column -> export column) are passed on to import_data.
+        """
+        from flask import request, jsonify, Response
+
+        usr = self.parent_login()
+        if usr is None:
+            return Response('Login required', 401,
+                            {'WWW-Authenticate': 'Basic realm="import"'})
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify(error='No file uploaded'), 400
+        try:
+            counts = self.import_data(
+                upload.stream, upload.filename or '',
+                request.form.get('child'),
+                json.loads(request.form.get('columns') or '{}'), usr)
+        except ValueError as error:
+            return jsonify(error=str(error)), 400
+        if counts is None:
+            return jsonify(error='No such child'), 404
+        return jsonify(counts)
+
+    def register_callbacks(self, app):
+        """Add the callbacks of the app."""
+        from dash.dependencies import Input, Output, State, ClientsideFunction
+
+        app.callback(Output('input-form', 'children'),
+                     [Input('checkboxes', 'value')])(
+            metrics.instrument(self.make_inputs, self.profiling))
+        app.callback(
+            Output('numclicks', 'children'),
+            [Input('submit-button', 'n_clicks')],
+            [State('numclicks', 'children'),
+             State('setdate', 'date'),
+             State('new_weight', 'value'),
+             State('new_height', 'value'),
+             State('new_head', 'value'),
+             State('new_comment', 'value'),
+             State('setchild', 'value')])(
+            metrics.instrument(self.new_datapoint, self.profiling))
+        app.callback(
+            Output('numchanges', 'children'),
+            [Input('edit-button', 'n_clicks'),
+             Input('delete-button', 'n_clicks')],
+            [State('numchanges', 'children'),
+             State('setdate', 'date'),
+             State('new_weight', 'value'),
+             State('new_height', 'value'),
+             State('new_head', 'value'),
+             State('new_comment', 'value'),
+             State('setchild', 'value')])(
+            metrics.instrument(self.change_datapoint, self.profiling))
+        app.clientside_callback(
+            ClientsideFunction(namespace='gottenso',
+                               function_name='poll_version'),
+            Output('poll-status', 'children'),
+            [Input('poll', 'n_intervals')])
+        if self.clientside_units:
+            app.callback(
+                Output('figure-store', 'data'),
+                [Input('numclicks', 'children'),
+                 Input('children', 'value'),
+                 Input('numchanges', 'children'),
+                 Input('refresh', 'n_clicks')])(
+                metrics.instrument(self.update_figure_data,
+                                   self.profiling))
+            app.clientside_callback(
+                ClientsideFunction(namespace='gottenso',
+                                   function_name='show_figure'),
+                Output('mainplot', 'figure'),
+                [Input('figure-store', 'data'), Input('checkboxes', 'value'),
+                 Input('weightdrop', 'value'), Input('agedrop', 'value'),
+                 Input('derivedrop', 'value')])
+        else:
+            app.callback(
+                Output('mainplot', 'figure'),
+                [Input('checkboxes', 'value'), Input('numclicks', 'children'),
+                 Input('weightdrop', 'value'),
+                 Input('agedrop', 'value'), Input('children', 'value'),
+                 Input('numchanges', 'children'),
+                 Input('refresh', 'n_clicks'),
+                 Input('derivedrop', 'value')])(
+                metrics.instrument(self.update_figure, self.profiling))
+
+
+def create_app(settings=None):
+    """
+    Create the Dash app. settings overrides the settings from the
+    environment (see load_settings); the Gottenso instance with the data
+    and caches is available as app.gottenso.
+    """
+    import dash
+    import dash_auth
+    import compression
+
+    settings = load_settings(settings) if settings else default_settings()
+    gottenso = Gottenso(settings)
+
+    # compressed by the Compressor below instead
+    app = dash.Dash(__name__, external_stylesheets=external_stylesheets,
+                    compress=False)
+    app.config['suppress_callback_exceptions'] = True
+    app.title = settings['APPNAME']
+    dash_auth.BasicAuth(app, gottenso.registry.passwords())
+    app.server.add_url_rule('/metrics', 'metrics', gottenso.metrics_page)
+    compression.Compressor(settings['COMPRESS_MIN_BYTES'],
+                           settings['COMPRESS_CACHE_SIZE']).init_app(
+        app.server)
+    app.server.add_url_rule('/version', 'version', gottenso.version_page)
+    app.server.add_url_rule('/import', 'import', gottenso.import_page,
+                            methods=['POST'])
+    app.layout = gottenso.serve_layout
+    gottenso.register_callbacks(app)
+    app.gottenso = gottenso
+
+    gottenso.access_log.log('Server rebooted')
+    return app
+
+
+_default_app = None
+_default_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # app.app and app.server create the default app on first use, so that
+    # `gunicorn app:server` keeps working.
+    global _default_app
+    if name not in ('app', 'server'):
+        raise AttributeError("module %r has no attribute %r"
+                             % (__name__, name))
+    with _default_lock:
+        if _default_app is None:
+            _default_app = create_app()
+    return _default_app if name == 'app' else _default_app.server
 
 
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    create_app().run_server(debug=True)
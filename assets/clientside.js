@@ -0,0 +1,131 @@
+/*
+ * Clientside version of the unit and visibility switching, used when
+ * CLIENTSIDE_UNITS is set. The server sends every trace once, in g and
+ * days, tagged with meta = [series, measure]; the checkboxes and the unit
+ * dropdowns are then applied here without a round-trip to the server.
+ *
+ * poll_version asks the server for the version of the data every
+ * POLL_SECONDS (while the page is visible), and clicks the hidden refresh
+ * button when it changes, to fetch the figure again.
+ */
+var gottenso_poll = {etag: null, pending: false};
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    gottenso: {
+        show_figure: function(store, checkbox, weight_pref, age_pref,
+                              derived) {
+            if (!store) {
+                return window.dash_clientside.no_update;
+            }
+            var checked = function(value) {
+                return checkbox.indexOf(value) >= 0;
+            };
+            var shown = {
+                child: true,
+                gro: checked('gro_curves'),
+                p1: checked('showp1'),
+                p2: checked('showp2'),
+                wt: checked('show_wt'),
+                ht: checked('show_ht')
+            };
+            // the derived metrics (see derived_metrics), one at a time
+            Object.keys(store.labels.derived).forEach(function(metric) {
+                shown[metric] = (metric === derived);
+            });
+            var zoom = checked('zoom') && store.limit !== null;
+            var labels = store.labels;
+            var age_scale = (age_pref === 'days') ? 1 : 1 / 365.25;
+            var weight_scale = (weight_pref === 'g') ? 1 : 1 / 1000;
+            var hover_age = (age_pref === 'days') ? labels.age_d : labels.age_y;
+            var hover_w = (weight_pref === 'g') ? labels.w_g : labels.w_kg;
+
+            var data = [];
+            store.figure.data.forEach(function(trace) {
+                var series = trace.meta[0];
+                var measure = trace.meta[1];
+                if (!shown[series] || !shown[measure]) {
+                    return;
+                }
+                var keep = trace.x.map(function(x) {
+                    return !zoom || series === 'child' || x < store.limit;
+                });
+                var pick = function(values) {
+                    if (!Array.isArray(values)) {
+                        return values;
+                    }
+                    return values.filter(function(value, i) {
+                        return keep[i];
+                    });
+                };
+                var scale = function(values, factor) {
+                    return values.map(function(value) {
+                        return (value === null) ? null : value * factor;
+                    });
+                };
+                var shown_trace = Object.assign({}, trace, {
+                    x: scale(pick(trace.x), age_scale),
+                    y: scale(pick(trace.y),
+                             (measure === 'wt') ? weight_scale : 1),
+                    text: pick(trace.text),
+                    customdata: pick(trace.customdata)
+                });
+                if (series !== 'gro' &&
+                        (measure === 'wt' || measure === 'ht')) {
+                    shown_trace.hovertemplate = labels.date + hover_age +
+                        ((measure === 'wt') ? hover_w : labels.h);
+                } else if (measure in labels.derived) {
+                    shown_trace.hovertemplate = labels.date + hover_age +
+                        '<b>' + labels.derived[measure] + '</b>: %{y:.1f}';
+                }
+                data.push(shown_trace);
+            });
+
+            var layout = JSON.parse(JSON.stringify(store.figure.layout));
+            layout.xaxis.title = {
+                text: (age_pref === 'days') ? labels.axis_age_d : labels.axis_age_y
+            };
+            layout.yaxis.title = {
+                text: (weight_pref === 'g') ? labels.axis_w_g : labels.axis_w_kg
+            };
+            if (derived) {
+                layout.yaxis3.title = {
+                    text: '<b>' + labels.derived[derived] + '</b>'
+                };
+            } else {
+                delete layout.yaxis3;
+                layout.xaxis.domain = [0, 1];
+            }
+            return {data: data, layout: layout};
+        },
+
+        poll_version: function(n_intervals) {
+            var no_update = window.dash_clientside.no_update;
+            if (!n_intervals || document.hidden || gottenso_poll.pending) {
+                return no_update;
+            }
+            var headers = {};
+            if (gottenso_poll.etag) {
+                headers['If-None-Match'] = gottenso_poll.etag;
+            }
+            gottenso_poll.pending = true;
+            fetch('/version', {headers: headers, cache: 'no-cache',
+                               credentials: 'same-origin'})
+                .then(function(response) {
+                    // 304 if the data hasn't changed
+                    if (response.status !== 200) {
+                        return;
+                    }
+                    var etag = response.headers.get('ETag');
+                    if (gottenso_poll.etag && etag !== gottenso_poll.etag) {
+                        document.getElementById('refresh').click();
+                    }
+                    gottenso_poll.etag = etag;
+                })
+                .catch(function() {})
+                .finally(function() {
+                    gottenso_poll.pending = false;
+                });
+            return no_update;
+        }
+    }
+});
@@ -0,0 +1,238 @@
+"""
+Benchmarks for loading data, adding data points and rendering figures.
+
+For each size, synthetic child, parent and growth curve .csv files with
+that many rows are generated in a temporary directory, and a separate
+Python process (so that the peak memory is per size) imports the app
+configured to use them and times:
+
+- load_datafile on the growth curve file,
+- new_datapoint (one submit),
+- update_figure for every combination of checkboxes and units, along
+  with the size of the figure JSON,
+- update_figure with each of the derived metrics (the "Also plot"
+  dropdown).
+
+Run from the repo root, e.g.
+
+    python benchmarks/bench.py --sizes 10 1000 100000 --output new.json
+    python benchmarks/bench.py --compare base.json new.json
+
+The second form exits with an error if any timing in new.json is more
+than --threshold times the one in base.json.
+"""
+
+import argparse
+import datetime as dt
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETTINGS = {
+    'APPLANG': 'en',
+    'APPNAME': 'gottenso',
+    'FAMILY': 'family',
+    'PARENT': 'parent',
+    'AGECOL': 'Age',
+    'COMCOL': 'Comment',
+    'DATECOL': 'Date',
+    'HEADCOL': 'Head_circumference',
+    'HEIGHTCOL': 'Height',
+    'WEIGHTCOL': 'Weight',
+    'SDWTCOL': 'sd_wt',
+    'SDHTCOL': 'sd_ht',
+    'CHILDBDAY': '20210101',
+    'CHILDNAME': 'Charlie',
+    'MAX_AGE': '3',
+    'P1BDAY': '19810101',
+    'P1NAME': 'Alice',
+    'P2BDAY': '19850505',
+    'P2NAME': 'Bob',
+}
+
+CHECKBOXES = ['show_wt', 'show_ht', 'gro_curves', 'showp1', 'showp2', 'zoom']
+UNITS = [('g', 'days'), ('g', 'years'), ('kg', 'days'), ('kg', 'years')]
+DERIVED = ['wt_velocity', 'ht_velocity', 'bmi', 'wfh']
+
+
+def make_data(directory, rows):
+    """Write synthetic data files with the given number of rows."""
+    import numpy as np
+    import pandas as pd
+
+    age = np.arange(rows)
+    growth = np.log1p(age / 30)
+    files = {}
+    for name in ('child', 'p1', 'p2', 'gro'):
+        data = pd.DataFrame({
+            'Age': age,
+            'Weight': (3500 + 2500 * growth).round(),
+            'Height': (50 + 12 * growth).round(1)})
+        if name == 'child':
+            data['Date'] = [(dt.date(2021, 1, 1) +
+                             dt.timedelta(days=int(days))).isoformat()
+                            for days in age]
+            data['Head_circumference'] = (35 + 4 * growth).round(1)
+            data['Comment'] = np.where(age % 10 == 0, 'Comment', '')
+        if name == 'gro':
+            data['sd_wt'] = 300 + 200 * growth
+            data['sd_ht'] = 2 + growth
+        files[name] = os.path.join(directory, name + '.csv')
+        data.to_csv(files[name], index=False)
+    return files
+
+
+def timed(func, repeat):
+    """Return the median wall time of func() over repeat runs."""
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def run(rows, repeat):
+    """Time the app on rows rows of data; runs in its own process."""
+    with tempfile.TemporaryDirectory() as directory:
+        files = make_data(directory, rows)
+        os.environ.update(SETTINGS)
+        os.environ.update({'CFILE': files['child'], 'P1FILE': files['p1'],
+                           'P2FILE': files['p2'], 'GROFILE': files['gro'],
+                           'LOGFILE': os.path.join(directory, 'log.txt')})
+        sys.path.insert(0, ROOT)
+        os.chdir(ROOT)
+        import app
+
+        gottenso = app.create_app().gottenso
+        result = {'load_datafile': timed(
+            lambda: app.load_datafile(files['gro']), repeat)}
+
+        clicks = itertools.count(1)
+
+        def submit():
+            click = next(clicks)
+            gottenso.new_datapoint(click, click - 1,
+                                   dt.date.today().isoformat(),
+                                   '4000', '55.5', '38', 'Benchmark')
+        result['new_datapoint'] = timed(submit, repeat)
+
+        figures = {}
+        for n in range(len(CHECKBOXES) + 1):
+            for checkbox in itertools.combinations(CHECKBOXES, n):
+                for weight_pref, age_pref in UNITS:
+                    def render():
+                        gottenso.render_figure.cache_clear()
+                        gottenso.update_figure(list(checkbox), 0,
+                                               weight_pref, age_pref,
+                                               derived=None)
+                    key = '+'.join(checkbox) + '/' + weight_pref + '/' + \
+                        age_pref
+                    figures[key] = {
+                        'time': timed(render, repeat),
+                        'bytes': len(gottenso.render_figure(
+                            tuple(sorted(checkbox)), weight_pref, age_pref,
+                            '', ('child',), gottenso.data_version(),
+                            gottenso.language, ()))}
+        for metric in DERIVED:
+            def render():
+                gottenso.render_figure.cache_clear()
+                gottenso.update_figure(['show_wt', 'show_ht'], 0, 'g',
+                                       'days', derived=metric)
+            figures['derived/' + metric] = {
+                'time': timed(render, repeat),
+                'bytes': len(gottenso.render_figure(
+                    ('show_ht', 'show_wt'), 'g', 'days', '', ('child',),
+                    gottenso.data_version(), gottenso.language,
+                    (metric,)))}
+        result['update_figure'] = figures
+        result['update_figure_total'] = sum(
+            figure['time'] for figure in figures.values())
+        result['peak_rss_kb'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss
+        gottenso.access_log.close()
+    return result
+
+
+def timings(results):
+    """Flatten the timings of a results file to {name: seconds}."""
+    flat = {}
+    for rows, result in results['sizes'].items():
+        for stage in ('load_datafile', 'new_datapoint',
+                      'update_figure_total'):
+            flat[rows + '/' + stage] = result[stage]
+        for key, figure in result['update_figure'].items():
+            flat[rows + '/update_figure/' + key] = figure['time']
+    return flat
+
+
+def compare(base, new, threshold, minimum=1e-3):
+    """
+    Return the timings of new that are more than threshold times slower
+    than in base (ignoring those under minimum seconds, which are noise).
+    """
+    base_times = timings(base)
+    regressions = []
+    for name, seconds in timings(new).items():
+        if name in base_times and seconds > minimum and \
+                seconds > threshold * base_times[name]:
+            regressions.append((name, base_times[name], seconds))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 100, 1000, 10000, 100000, 1000000],
+                        help='numbers of rows to benchmark')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per timing (the median is kept)')
+    parser.add_argument('--output', default='bench_results.json',
+                        help='where to write the results')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                        help='compare two results files instead')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown that counts as a regression')
+    parser.add_argument('--run', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        json.dump(run(args.run, args.repeat), sys.stdout)
+    elif args.compare:
+        with open(args.compare[0]) as base, open(args.compare[1]) as new:
+            regressions = compare(json.load(base), json.load(new),
+                                  args.threshold)
+        for name, before, after in regressions:
+            print('%s: %.4f s -> %.4f s' % (name, before, after))
+        sys.exit(1 if regressions else 0)
+    else:
+        results = {'commit': git_commit(),
+                   'python': platform.python_version(),
+                   'date': dt.datetime.now().isoformat(timespec='seconds'),
+                   'sizes': {}}
+        for rows in args.sizes:
+            print('Benchmarking ' + str(rows) + ' rows', file=sys.stderr)
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__),
+                 '--run', str(rows), '--repeat', str(args.repeat)],
+                capture_output=True, text=True, check=True).stdout
+            results['sizes'][str(rows)] = json.loads(output)
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
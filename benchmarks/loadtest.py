@@ -0,0 +1,322 @@
+"""
+Load test: many family members using the dashboard at once.
+
+Simulated users open the dashboard and click around in it, each in its
+own thread, sending the same requests as the browser: the layout and
+the _dash-update-component callbacks for make_inputs, update_figure and
+(for the parent users) new_datapoint. They log in as `parent` or
+`family`, in the proportion given by --parents.
+
+The requests go either to app.server in the worker processes, through
+the Flask test client, on synthetic data (see bench.py) in a temporary
+directory; or over HTTP to a running server (--url), e.g. gunicorn with
+several workers. With several in-process --workers, each has its own
+app on the same files, like gunicorn's workers do.
+
+Throughput, the p50/p95/p99 latency and the error rate of each kind of
+request are reported. Every submitted data point has a unique comment,
+and after the run the child's .csv file is checked for the ones that
+were lost.
+
+    python benchmarks/loadtest.py --workers 4 --users 16 --sessions 5
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 \\
+        --cfile data/child_data.csv --parent-password ... \\
+        --family-password ...
+"""
+
+import argparse
+import base64
+import concurrent.futures
+import datetime as dt
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench import (ROOT, SETTINGS, CHECKBOXES, UNITS, DERIVED,  # noqa: E402
+                   make_data)
+
+MARKER = 'loadtest'
+
+
+def prop(component, name, value):
+    return {'id': component, 'property': name, 'value': value}
+
+
+def callback(output, inputs, state=(), changed=None):
+    """The body of a _dash-update-component request."""
+    component, name = output.split('.')
+    return {'output': output,
+            'outputs': {'id': component, 'property': name},
+            'inputs': list(inputs), 'state': list(state),
+            'changedPropIds': [changed or inputs[0]['id'] + '.' +
+                               inputs[0]['property']]}
+
+
+def figure_request(checkbox, clicks, weight_pref, age_pref, derived=None):
+    return callback('mainplot.figure', [
+        prop('checkboxes', 'value', checkbox),
+        prop('numclicks', 'children', clicks),
+        prop('weightdrop', 'value', weight_pref),
+        prop('agedrop', 'value', age_pref),
+        prop('children', 'value', None),
+        prop('numchanges', 'children', 0),
+        prop('refresh', 'n_clicks', 0),
+        prop('derivedrop', 'value', derived)])
+
+
+def inputs_request(checkbox):
+    return callback('input-form.children',
+                    [prop('checkboxes', 'value', checkbox)])
+
+
+def submit_request(clicks, date, comment):
+    return callback('numclicks.children', [
+        prop('submit-button', 'n_clicks', clicks)], [
+        prop('numclicks', 'children', clicks - 1),
+        prop('setdate', 'date', date),
+        prop('new_weight', 'value', str(random.randint(3000, 12000))),
+        prop('new_height', 'value', '%.1f' % random.uniform(50, 90)),
+        prop('new_head', 'value', None),
+        prop('new_comment', 'value', comment),
+        prop('setchild', 'value', None)])
+
+
+class TestClient:
+    """Requests to a Flask app in this process."""
+
+    def __init__(self, server):
+        self.client = server.test_client()
+
+    def request(self, path, body=None, headers=None):
+        if body is None:
+            response = self.client.get(path, headers=headers)
+        else:
+            response = self.client.post(path, json=body, headers=headers)
+        response.get_data()
+        return response.status_code
+
+
+class HttpClient:
+    """Requests over HTTP to a running server."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def request(self, path, body=None, headers=None):
+        headers = dict(headers or {})
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.url + path, data=data,
+                                         headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+        except OSError:
+            return 0
+
+
+def session(client, user, password, parent, args, name, timings):
+    """
+    One visit to the dashboard: load the page, then change the
+    checkboxes and units a few times, submitting data points in between
+    if parent is set. Appends (request, seconds, status) to timings, and
+    returns the comments of the data points submitted.
+    """
+    auth = {'Authorization': 'Basic ' + base64.b64encode(
+        (user + ':' + password).encode()).decode()}
+
+    def send(kind, path, body=None):
+        start = time.perf_counter()
+        status = client.request(path, body, auth)
+        timings.append((kind, time.perf_counter() - start, status))
+        return status
+
+    send('layout', '/_dash-layout')
+    send('dependencies', '/_dash-dependencies')
+    checkbox = ['show_wt', 'show_ht', 'gro_curves']
+    weight_pref, age_pref = 'g', 'days'
+    derived = None
+    send('make_inputs', '/_dash-update-component', inputs_request(checkbox))
+    send('update_figure', '/_dash-update-component',
+         figure_request(checkbox, 0, weight_pref, age_pref))
+    submitted = []
+    clicks = 0
+    for i in range(args.clicks):
+        if parent and random.random() < args.submit_rate:
+            clicks += 1
+            comment = '%s %s %d' % (MARKER, name, clicks)
+            date = (dt.date(2021, 1, 1) + dt.timedelta(
+                days=random.randint(0, 2000))).isoformat()
+            if send('new_datapoint', '/_dash-update-component',
+                    submit_request(clicks, date, comment)) == 200:
+                submitted.append(comment)
+        else:
+            checkbox = [box for box in CHECKBOXES if random.random() < 0.5]
+            weight_pref, age_pref = random.choice(UNITS)
+            derived = random.choice([None] + DERIVED)
+        send('update_figure', '/_dash-update-component',
+             figure_request(checkbox, clicks, weight_pref, age_pref,
+                            derived))
+        if args.think:
+            time.sleep(random.uniform(0, 2 * args.think))
+    return submitted
+
+
+def run_worker(worker, args, settings):
+    """Run this worker's share of the users; returns timings, comments."""
+    if args.url:
+        def make_client():
+            return HttpClient(args.url)
+    else:
+        sys.path.insert(0, ROOT)
+        os.chdir(ROOT)
+        import app
+
+        dash_app = app.create_app(settings)
+
+        def make_client():
+            return TestClient(dash_app.server)
+    random.seed(worker)
+    users = range(worker, args.users, args.workers)
+    timings = []
+    submitted = []
+    lock = threading.Lock()
+
+    def user_sessions(user):
+        client = make_client()
+        parent = user < args.users * args.parents
+        login, password = ('parent', args.parent_password) if parent else \
+            ('family', args.family_password)
+        for i in range(args.sessions):
+            times = []
+            comments = session(client, login, password, parent, args,
+                               '%d-%d' % (user, i), times)
+            with lock:
+                timings.extend(times)
+                submitted.extend(comments)
+
+    with concurrent.futures.ThreadPoolExecutor(len(users) or 1) as users_pool:
+        for future in [users_pool.submit(user_sessions, user)
+                       for user in users]:
+            future.result()
+    if not args.url:
+        dash_app.gottenso.access_log.close()
+    return timings, submitted
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def report(timings, seconds):
+    """Throughput, latency percentiles and error rate per kind of request."""
+    kinds = sorted({kind for kind, _, _ in timings})
+    result = {'seconds': seconds, 'requests': len(timings),
+              'throughput': len(timings) / seconds, 'requests_by_kind': {}}
+    for kind in kinds + ['all']:
+        times = [(latency, status) for name, latency, status in timings
+                 if kind in ('all', name)]
+        latencies = [latency for latency, _ in times]
+        # a PreventUpdate is a 204
+        errors = sum(status not in (200, 204) for _, status in times)
+        result['requests_by_kind'][kind] = {
+            'count': len(times),
+            'p50_ms': 1000 * percentile(latencies, 50),
+            'p95_ms': 1000 * percentile(latencies, 95),
+            'p99_ms': 1000 * percentile(latencies, 99),
+            'error_rate': errors / len(times)}
+    return result
+
+
+def lost_writes(cfile, submitted):
+    """The submitted comments that are not in the child's .csv file."""
+    import pandas as pd
+
+    data = pd.read_csv(cfile)
+    found = set(data[SETTINGS['COMCOL']].dropna())
+    return sorted(set(submitted) - found)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--url', help='the server to test (default: the '
+                                      'app in the worker processes)')
+    parser.add_argument('--cfile', help="with --url, the child's .csv file, "
+                                        'to check for lost writes')
+    parser.add_argument('--rows', type=int, default=1000,
+                        help='rows of synthetic data (without --url)')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='processes to send the requests from')
+    parser.add_argument('--users', type=int, default=8,
+                        help='simulated users, each in its own thread')
+    parser.add_argument('--parents', type=float, default=0.25,
+                        help='the fraction of users logged in as parent')
+    parser.add_argument('--sessions', type=int, default=3,
+                        help='dashboard visits per user')
+    parser.add_argument('--clicks', type=int, default=5,
+                        help='interactions per visit')
+    parser.add_argument('--submit-rate', type=float, default=0.5,
+                        help='for parents, the fraction of interactions '
+                             'that submit a data point')
+    parser.add_argument('--think', type=float, default=0,
+                        help='mean pause between interactions, in seconds')
+    parser.add_argument('--parent-password', default=SETTINGS['PARENT'])
+    parser.add_argument('--family-password', default=SETTINGS['FAMILY'])
+    parser.add_argument('--output', help='write the results as JSON here')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings = dict(SETTINGS)
+        cfile = args.cfile
+        if not args.url:
+            files = make_data(directory, args.rows)
+            cfile = files['child']
+            settings.update({'CFILE': cfile, 'P1FILE': files['p1'],
+                             'P2FILE': files['p2'], 'GROFILE': files['gro'],
+                             'LOGFILE': os.path.join(directory, 'log.txt')})
+        start = time.perf_counter()
+        # forked, like gunicorn's workers
+        context = multiprocessing.get_context('fork')
+        with concurrent.futures.ProcessPoolExecutor(
+                args.workers, mp_context=context) as pool:
+            results = list(pool.map(run_worker, range(args.workers),
+                                    [args] * args.workers,
+                                    [settings] * args.workers))
+        result = report([timing for timings, _ in results
+                         for timing in timings],
+                        time.perf_counter() - start)
+        submitted = [comment for _, comments in results
+                     for comment in comments]
+        result['submitted'] = len(submitted)
+        if cfile:
+            result['lost_writes'] = lost_writes(cfile, submitted)
+
+    print('%d requests in %.1f s, %.1f/s' % (
+        result['requests'], result['seconds'], result['throughput']))
+    print('%-14s %7s %9s %9s %9s %7s' % ('', 'count', 'p50 ms', 'p95 ms',
+                                         'p99 ms', 'errors'))
+    for kind, stats in result['requests_by_kind'].items():
+        print('%-14s %7d %9.1f %9.1f %9.1f %6.1f%%' % (
+            kind, stats['count'], stats['p50_ms'], stats['p95_ms'],
+            stats['p99_ms'], 100 * stats['error_rate']))
+    if 'lost_writes' in result:
+        print('%d data points submitted, %d lost' % (
+            result['submitted'], len(result['lost_writes'])))
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(result, outfile, indent=2)
+    sys.exit(1 if result.get('lost_writes') else 0)
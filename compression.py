@@ -0,0 +1,94 @@
+"""
+Compression and ETags for the responses of the app.
+
+Responses of a compressible type (JSON, HTML, JavaScript, CSS, text)
+larger than `min_bytes` are compressed with Brotli if it's installed and
+the browser accepts it, else with gzip. The compressed bytes are kept,
+keyed by a hash of the uncompressed ones, for the `cache_size` most
+recently sent responses: when a figure comes out of the figure cache,
+its response is the same as the last time, and isn't compressed again.
+
+Every such response gets a strong ETag (the hash, and the encoding), so
+that a GET with a matching If-None-Match is answered with a bodiless 304.
+Dash sends its callbacks as POSTs, which browsers don't revalidate, so
+for those only the compression applies.
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+import metrics
+
+COMPRESSIBLE = ('application/json', 'application/javascript', 'text/')
+
+
+class Compressor:
+    def __init__(self, min_bytes=1000, cache_size=32):
+        self.min_bytes = min_bytes
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+        self._brotli = brotli
+
+    def init_app(self, server):
+        """Compress the responses of a Flask server."""
+        server.after_request(self.after_request)
+
+    def encoding(self, accepted):
+        """The encoding to use for a request's Accept-Encoding."""
+        if self._brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    def compress(self, body, encoding):
+        """Return body compressed with encoding."""
+        if encoding == 'br':
+            return self._brotli.compress(body, quality=5)
+        return gzip.compress(body, compresslevel=6)
+
+    def after_request(self, response):
+        from flask import request
+
+        if response.status_code != 200 or response.direct_passthrough or \
+                response.is_streamed or 'Content-Encoding' in response.headers \
+                or not response.mimetype.startswith(COMPRESSIBLE):
+            return response
+        body = response.get_data()
+        if len(body) < self.min_bytes:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.encoding(request.accept_encodings)
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        etag = digest + '-' + encoding if encoding else digest
+        response.set_etag(etag)
+        if request.method in ('GET', 'HEAD') and \
+                etag in request.if_none_match:
+            response.status_code = 304
+            response.set_data(b'')
+            return response
+        if encoding is None:
+            return response
+        key = (digest, encoding)
+        with self._lock:
+            compressed = self._cache.get(key)
+            if compressed is not None:
+                self._cache.move_to_end(key)
+        metrics.inc('gottenso_cache_total', cache='compressed',
+                    result='miss' if compressed is None else 'hit')
+        if compressed is None:
+            with metrics.timer('compress', encoding=encoding):
+                compressed = self.compress(body, encoding)
+            with self._lock:
+                self._cache[key] = compressed
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
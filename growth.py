@@ -0,0 +1,199 @@
+"""
+Numerical helpers for the growth data and reference curves.
+"""
+
+import numpy as np
+
+
+def lttb(x, y, n):
+    """
+    Return the indices of (at most) n points of the curve y(x), chosen
+    with the Largest-Triangle-Three-Buckets algorithm so that the curve
+    keeps its visual shape. x must be sorted. The first and last points
+    are always kept.
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    # n - 2 buckets between the first and the last point
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    keep = np.empty(n, dtype=int)
+    keep[0] = 0
+    keep[-1] = size - 1
+    prev = 0
+    for i in range(n - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            following = slice(edges[i + 1], edges[i + 2])
+        else:
+            following = slice(size - 1, size)
+        avg_x = x[following].mean()
+        avg_y = y[following].mean()
+        area = np.abs((x[prev] - avg_x) * (y[start:stop] - y[prev]) -
+                      (x[prev] - x[start:stop]) * (avg_y - y[prev]))
+        prev = start + int(np.argmax(area))
+        keep[i + 1] = prev
+    return keep
+
+
+def downsample(x, ys, n):
+    """
+    Return the sorted indices of (at most) n points to plot for the
+    curves ys (a list of arrays) sharing the x values. Each curve gets an
+    equal share of the points, and missing (NaN) values are left out.
+    """
+    x = np.asarray(x, dtype='float64')
+    keep = []
+    for y in ys:
+        y = np.asarray(y, dtype='float64')
+        valid = np.flatnonzero(~np.isnan(y))
+        keep.append(valid[lttb(x[valid], y[valid], n // len(ys))])
+    return np.unique(np.concatenate(keep)) if keep else np.arange(len(x))
+
+
+def normal_cdf(z):
+    """
+    The standard normal distribution function, for an array of z-scores
+    (the erf approximation 7.1.26 of Abramowitz & Stegun, to within
+    1e-7; numpy has no erf).
+    """
+    z = np.asarray(z, dtype='float64')
+    x = np.abs(z) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (
+        1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1 - poly * np.exp(-x * x)
+    return 0.5 * (1 + np.sign(z) * erf)
+
+
+def sorted_by(keys, *arrays):
+    """
+    Return the float arrays keys and arrays, sorted by keys. Float arrays
+    that are already sorted are returned as they are, without a copy, so
+    that memory-mapped data (e.g. float32 .npy files) stays shared.
+    """
+    arrays = [np.asarray(array) for array in (keys,) + arrays]
+    arrays = [array if np.issubdtype(array.dtype, np.floating)
+              else array.astype('float64') for array in arrays]
+    keys = arrays[0]
+    if len(keys) < 2 or np.all(keys[1:] >= keys[:-1]):
+        return arrays
+    order = np.argsort(keys, kind='stable')
+    return [array[order] for array in arrays]
+
+
+class Reference:
+    """
+    A growth reference for one measure: either the mean and SD, or the
+    L, M and S parameters (as in the WHO tables), over an age grid.
+
+    The grid is sorted once (if it isn't already; a sorted grid is used
+    as it is, see sorted_by), and the position of each age in it is found
+    with a single searchsorted for all the parameters. Ages outside the
+    grid get no score (NaN).
+    """
+
+    def __init__(self, age, mean=None, sd=None, lms=None):
+        params = lms if lms is not None else (mean, sd)
+        self.age, *self.params = sorted_by(age, *params)
+        self.lms = lms is not None
+
+    def interpolate(self, ages):
+        """Return the parameters at the given ages, linearly interpolated."""
+        ages = np.asarray(ages, dtype='float64')
+        right = np.clip(np.searchsorted(self.age, ages), 1,
+                        len(self.age) - 1)
+        left = right - 1
+        span = self.age[right] - self.age[left]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(span > 0, (ages - self.age[left]) / span, 0)
+        outside = (ages < self.age[0]) | (ages > self.age[-1])
+        return [np.where(outside, np.nan,
+                         param[left] + weight * (param[right] - param[left]))
+                for param in self.params]
+
+    def values(self, ages, z):
+        """Return the values with the z-score z at the given ages."""
+        if self.lms:
+            l, m, s = self.interpolate(ages)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(np.abs(l) < 1e-9, m * np.exp(s * z),
+                                m * (1 + l * s * z) ** (1 / l))
+        mean, sd = self.interpolate(ages)
+        return mean + z * sd
+
+    def z_scores(self, ages, values):
+        """Return the z-scores of the values measured at the ages."""
+        values = np.asarray(values, dtype='float64')
+        if len(self.age) < 2:
+            return np.full(values.shape, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if self.lms:
+                l, m, s = self.interpolate(ages)
+                ratio = values / m
+                return np.where(np.abs(l) < 1e-9, np.log(ratio) / s,
+                                (ratio ** l - 1) / (l * s))
+            mean, sd = self.interpolate(ages)
+            return (values - mean) / sd
+
+
+def percentiles(z):
+    """Return the percentiles (0-100) of an array of z-scores."""
+    return 100 * normal_cdf(z)
+
+
+def normal_quantile(p):
+    """
+    The z-score of a percentile (0-100), by inverting normal_cdf on a
+    fine grid (to within 1e-4 for percentiles between 0.001 and 99.999).
+    """
+    grid = np.linspace(-6, 6, 120001)
+    return np.interp(np.asarray(p, dtype='float64') / 100,
+                     normal_cdf(grid), grid)
+
+
+def velocity(ages, values, days=7, previous=None):
+    """
+    Return the change of values per `days` days since the previous
+    measured (not NaN) value, at every measured value; NaN elsewhere and
+    for the first one. previous is the (age, value) of the last value
+    measured before these, if any.
+    """
+    ages = np.asarray(ages, dtype='float64')
+    values = np.asarray(values, dtype='float64')
+    known = np.flatnonzero(~np.isnan(values))
+    known_ages = ages[known]
+    known_values = values[known]
+    first = 1
+    if previous is not None:
+        known_ages = np.concatenate([[previous[0]], known_ages])
+        known_values = np.concatenate([[previous[1]], known_values])
+        first = 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.diff(known_values) / np.diff(known_ages) * days
+    rates[~np.isfinite(rates)] = np.nan
+    result = np.full(len(values), np.nan)
+    result[known[first:]] = rates
+    return result
+
+
+def bmi(weights, heights):
+    """Return the body mass index of weights in g and heights in cm."""
+    weights = np.asarray(weights, dtype='float64')
+    heights = np.asarray(heights, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (weights / 1000) / (heights / 100) ** 2
+
+
+def weight_for_height(weights, heights, ref_heights, ref_weights):
+    """
+    Return the weights as percentages of the reference weight at the
+    same height (NaN outside of the reference's heights). ref_heights
+    must be sorted.
+    """
+    expected = np.interp(np.asarray(heights, dtype='float64'), ref_heights,
+                         ref_weights, left=np.nan, right=np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * np.asarray(weights, dtype='float64') / expected
@@ -0,0 +1,172 @@
+"""
+Bulk import of measurements, e.g. from a spreadsheet or the export of a
+baby tracker app.
+
+An export is a .csv file, or a .json file with a list of objects (or one
+object per line). It's read in chunks, and its columns are mapped to the
+ones of the data files (DATECOL, AGECOL, WEIGHTCOL, HEIGHTCOL, HEADCOL and
+COMCOL): by the mapping given, else by name, ignoring case. Weights and
+heights are converted to g/cm like the reference data, and the dates and
+ages are filled in from each other.
+
+Rows at an age (computed from their date) that is already in the data
+set, or earlier in the export, are skipped, as are rows with a date that
+is in the data set, and rows without a date or any measurement.
+The rest are written in one go, so an import of years of daily data is
+one write, and one new version of the data set.
+
+Running this file imports an export for a child, e.g.
+`python importer.py export.csv --column Weight=weight_kg`.
+"""
+
+import io
+import json
+from itertools import chain, islice
+import pandas as pd
+import metrics
+import storage
+
+COLUMNS = ('DATECOL', 'AGECOL', 'WEIGHTCOL', 'HEIGHTCOL', 'HEADCOL',
+           'COMCOL')
+
+
+def read_export(source, filename='', chunksize=storage.CHUNK_ROWS):
+    """
+    Yield the rows of an export (a file object or its contents) as
+    dataframes of strings, chunksize rows at a time. It's read as JSON if
+    filename ends with .json, .jsonl or .ndjson, else as .csv.
+    """
+    if isinstance(source, (bytes, str)):
+        source = io.BytesIO(source.encode() if isinstance(source, str)
+                            else source)
+    if not filename.lower().endswith(('.json', '.jsonl', '.ndjson')):
+        yield from pd.read_csv(source, dtype='string', chunksize=chunksize,
+                               skipinitialspace=True)
+        return
+    first = source.read(1)
+    while first.isspace():
+        first = source.read(1)
+    if first in ('[', b'['):
+        records = iter(json.loads(first + source.read()))
+    else:
+        lines = chain([first + source.readline()], source)
+        records = (json.loads(line) for line in lines if line.strip())
+    while True:
+        chunk = list(islice(records, chunksize))
+        if not chunk:
+            return
+        yield pd.DataFrame(chunk).astype('string')
+
+
+def column_mapping(settings, header, mapping=None):
+    """
+    Return the source column -> data file column mapping for an export
+    with the columns in header. mapping (data file column -> source
+    column) overrides the matching by name.
+    """
+    mapping = dict(mapping or {})
+    lower = {col.strip().lower(): col for col in header}
+    for setting in COLUMNS:
+        target = settings[setting]
+        if target not in mapping and target.lower() in lower:
+            mapping[target] = lower[target.lower()]
+    missing = set(mapping.values()) - set(header)
+    if missing:
+        raise ValueError('No column ' + ', '.join(sorted(missing)) +
+                         ' in the data')
+    return {source: target for target, source in mapping.items()}
+
+
+def normalize(chunk, settings, birth, mapping):
+    """
+    Map the columns of a chunk of an export, and convert its values
+    to the units and types of the data files. Returns a dataframe with
+    all the data file columns (NaN where a value is missing).
+    """
+    import app
+
+    columns = [settings[setting] for setting in COLUMNS]
+    datecol, agecol, weightcol, heightcol, headcol, comcol = columns
+    data = chunk.rename(columns=mapping).reindex(columns=columns).astype(
+        'string')
+    for col in (agecol, weightcol, heightcol, headcol):
+        data[col] = pd.to_numeric(data[col].str.replace(',', '.'),
+                                  errors='coerce')
+    dates = pd.to_datetime(data[datecol], errors='coerce')
+    birth = pd.Timestamp(birth.date())
+    dates = dates.dt.normalize().fillna(
+        birth + pd.to_timedelta(data[agecol].dropna().round(), unit='D'))
+    data[agecol] = (dates - birth).dt.days.astype('Int64')
+    data[datecol] = dates.dt.strftime('%Y-%m-%d')
+    data = app.normalize_units(data, settings)
+    data[weightcol] = data[weightcol].round().astype('Int64')
+    data[comcol] = data[comcol].str.strip().replace('', pd.NA)
+    return data
+
+
+def import_export(store, name, birth, source, settings, filename='',
+                  mapping=None, chunksize=storage.CHUNK_ROWS):
+    """
+    Import an export (see read_export) into the data set name of store,
+    for a child born at birth. mapping is as for column_mapping.
+
+    Returns a dict with the number of rows 'added', and of those skipped
+    as 'duplicates' (by date) or 'invalid'.
+    """
+    datecol, agecol = settings['DATECOL'], settings['AGECOL']
+    measures = [settings[setting] for setting in
+                ('WEIGHTCOL', 'HEIGHTCOL', 'HEADCOL', 'COMCOL')]
+    existing = store.read(name)
+    # the ages already in the data set, and in the export so far; and
+    # the dates of the rows of the data set that have one
+    ages = {float(age) for age in store.index(name)}
+    dates = set() if existing is None or datecol not in existing else \
+        set(existing[datecol].dropna())
+    counts = {'added': 0, 'duplicates': 0, 'invalid': 0}
+    rows = []
+    columns = None
+    with metrics.timer('import'):
+        for chunk in read_export(source, filename, chunksize):
+            if columns is None:
+                columns = column_mapping(settings, chunk.columns, mapping)
+            data = normalize(chunk, settings, birth, columns)
+            valid = data[datecol].notna() & data[measures].notna().any(
+                axis=1)
+            counts['invalid'] += int((~valid).sum())
+            data = data[valid]
+            age = data[agecol].astype('float64')
+            new = ~age.isin(ages) & ~age.duplicated() & \
+                ~data[datecol].isin(dates)
+            counts['duplicates'] += int((~new).sum())
+            data = data[new]
+            ages.update(age[new])
+            rows.extend(data.to_dict('records'))
+        if rows:
+            store.extend(name, rows, sort_by=agecol)
+    counts['added'] = len(rows)
+    return counts
+
+
+if __name__ == '__main__':
+    import argparse
+    import app
+
+    parser = argparse.ArgumentParser(
+        description='Import measurements from a .csv or .json export.')
+    parser.add_argument('export', help='the .csv or .json file')
+    parser.add_argument('--child', default=None,
+                        help='the data set of the child (default: the '
+                             'first child)')
+    parser.add_argument('--column', action='append', default=[],
+                        metavar='COLUMN=SOURCE',
+                        help='read the data file column COLUMN from the '
+                             'column SOURCE of the export')
+    args = parser.parse_args()
+
+    gottenso = app.Gottenso(app.load_settings())
+    mapping = dict(column.split('=', 1) for column in args.column)
+    with open(args.export, 'rb') as export:
+        counts = gottenso.import_data(export, args.export, args.child,
+                                      mapping)
+    print('Added %(added)d rows, skipped %(duplicates)d duplicates and '
+          '%(invalid)d invalid rows' % counts)
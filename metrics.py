@@ -0,0 +1,155 @@
+"""
+Latency, size and cache metrics, rendered in the Prometheus text format.
+
+Callbacks are timed with the instrument() decorator and the stages inside
+them with timer(). The metrics are kept per process: with several
+gunicorn workers, each scrape shows the worker that answered it.
+
+If the slow_ms setting (of instrument's options, else of settings) is
+set, every instrumented call is profiled, and the cProfile stats of
+calls slower than that are written to its profile_dir. Counters kept
+elsewhere, such as the hits of an app's caches, are passed to render by
+their owner, so that each app reports only its own.
+"""
+
+import bisect
+import cProfile
+import datetime as dt
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                1, 2.5, 5, 10)
+SIZE_BUCKETS = (1e3, 3e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+
+settings = {'slow_ms': 0, 'profile_dir': 'aux/profiles'}
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def observe(name, value, buckets=TIME_BUCKETS, **labels):
+    """Add value to the histogram name (with the given labels)."""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {
+                'buckets': buckets, 'counts': [0] * len(buckets),
+                'sum': 0.0, 'count': 0}
+        index = bisect.bisect_left(buckets, value)
+        if index < len(buckets):
+            hist['counts'][index] += 1
+        hist['sum'] += value
+        hist['count'] += 1
+
+
+def inc(name, value=1, **labels):
+    """Increase the counter name (with the given labels) by value."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextmanager
+def timer(stage, **labels):
+    """Time the enclosed code as the given stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('gottenso_stage_seconds', time.perf_counter() - start,
+                stage=stage, **labels)
+
+
+def instrument(func, options=None):
+    """
+    Time every call of a callback (and profile slow ones, see above).
+    options has the slow_ms and profile_dir to use instead of settings.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        opts = settings if options is None else options
+        profile = cProfile.Profile() if opts['slow_ms'] else None
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            observe('gottenso_callback_seconds', seconds,
+                    callback=func.__name__)
+            if profile is not None:
+                profile.disable()
+                if seconds * 1000 > opts['slow_ms']:
+                    dump_profile(profile, func.__name__, opts['profile_dir'])
+    return wrapper
+
+
+def dump_profile(profile, name, profile_dir=None):
+    profile_dir = profile_dir or settings['profile_dir']
+    os.makedirs(profile_dir, exist_ok=True)
+    nowstr = dt.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    profile.dump_stats(os.path.join(
+        profile_dir, name + '-' + nowstr + '.prof'))
+
+
+def _labelstr(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, str(value).replace('"', '\\"'))
+                          for name, value in pairs) + '}'
+
+
+def render(collectors=()):
+    """
+    Return all metrics in the Prometheus text format. collectors are
+    functions returning a list of (name, labels, value) for counters that
+    are kept elsewhere, such as the hits of an lru_cache.
+    """
+    lines = []
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+    typed = set()
+    for (name, labels), hist in histograms:
+        if name not in typed:
+            lines.append('# TYPE %s histogram' % name)
+            typed.add(name)
+        total = 0
+        for bound, count in zip(hist['buckets'], hist['counts']):
+            total += count
+            lines.append('%s_bucket%s %d' % (
+                name, _labelstr(labels, [('le', repr(float(bound)))]),
+                total))
+        lines.append('%s_bucket%s %d' % (
+            name, _labelstr(labels, [('le', '+Inf')]), hist['count']))
+        lines.append('%s_sum%s %r' % (name, _labelstr(labels), hist['sum']))
+        lines.append('%s_count%s %d' % (name, _labelstr(labels),
+                                        hist['count']))
+    collected = [(_key(name, labels), value)
+                 for collector in collectors
+                 for name, labels, value in collector()]
+    for (name, labels), value in sorted(counters + collected):
+        if name not in typed:
+            lines.append('# TYPE %s counter' % name)
+            typed.add(name)
+        lines.append('%s%s %r' % (name, _labelstr(labels), value))
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Forget all recorded metrics."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
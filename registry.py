@@ -0,0 +1,123 @@
+"""
+The families, children and users served by the app.
+
+A registry is either made from the single-family settings (CHILDNAME,
+P1FILE, PARENT, ...), or read from a JSON file (REGISTRY) such as
+
+    {"families": {"smith": {
+        "children": [{"name": "Charlie", "birthday": "20210101",
+                      "file": "data/charlie.csv"}],
+        "parents": [{"name": "Alice", "birthday": "19810101",
+                     "file": "data/alice.csv"}],
+        "users": {"alice": {"password": "...", "role": "parent"},
+                  "grandpa": {"password": "...", "role": "family",
+                              "language": "se"}}}}}
+
+Users with the 'parent' role can add data for the children of their
+family; all users see the family's data and nothing else. A family has
+at most two parents. A user's optional language overrides the one asked
+for by their browser.
+
+Only the names and files are kept here; the data itself is read on
+demand by the storage, which keeps a bounded number of data sets.
+"""
+
+import datetime as dt
+import json
+from collections import namedtuple
+
+# key is the name of the data set in the storage
+Person = namedtuple('Person', ['key', 'name', 'birth', 'file'])
+Family = namedtuple('Family', ['name', 'children', 'parents'])
+# language is the one the app is shown in for the user (None: the browser's)
+User = namedtuple('User', ['password', 'family', 'role', 'language'],
+                  defaults=(None,))
+
+ROLES = ('parent', 'family')
+
+
+def parse_birthday(birthday):
+    return dt.datetime.strptime(birthday, '%Y%m%d')
+
+
+class Registry:
+    def __init__(self, families, users):
+        self.families = families
+        self.users = users
+
+    @classmethod
+    def from_settings(cls, settings):
+        """The single family of the CHILDNAME, P1NAME, ... settings."""
+        family = Family(
+            name='',
+            children=(Person('child', settings['CHILDNAME'],
+                             parse_birthday(settings['CHILDBDAY']),
+                             settings['CFILE']),),
+            parents=(Person('p1', settings['P1NAME'],
+                            parse_birthday(settings['P1BDAY']),
+                            settings['P1FILE']),
+                     Person('p2', settings['P2NAME'],
+                            parse_birthday(settings['P2BDAY']),
+                            settings['P2FILE'])))
+        return cls({'': family},
+                   {'parent': User(settings['PARENT'], '', 'parent'),
+                    'family': User(settings['FAMILY'], '', 'family')})
+
+    @classmethod
+    def from_file(cls, filename):
+        """Read a registry from a JSON file (see above)."""
+        with open(filename) as regfile:
+            config = json.load(regfile)
+        families = {}
+        users = {}
+        for fname, fconfig in config['families'].items():
+            children = tuple(
+                Person('child-%s-%d' % (fname, i), child['name'],
+                       parse_birthday(child['birthday']), child['file'])
+                for i, child in enumerate(fconfig['children']))
+            parents = tuple(
+                Person('p%d-%s' % (i + 1, fname), parent['name'],
+                       parse_birthday(parent['birthday']), parent['file'])
+                for i, parent in enumerate(fconfig.get('parents', [])))
+            if not children:
+                raise ValueError('Family ' + fname + ' has no children')
+            if len(parents) > 2:
+                raise ValueError('Family ' + fname +
+                                 ' has more than two parents')
+            families[fname] = Family(fname, children, parents)
+            for uname, user in fconfig['users'].items():
+                if uname in users:
+                    raise ValueError('User ' + uname + ' is in two families')
+                if user['role'] not in ROLES:
+                    raise ValueError('Unknown role for user ' + uname)
+                users[uname] = User(user['password'], fname, user['role'],
+                                    user.get('language'))
+        return cls(families, users)
+
+    def passwords(self):
+        """Username -> password, for the login."""
+        return {name: user.password for name, user in self.users.items()}
+
+    def family(self, username=None):
+        """
+        Return the family of a user. Without a user (e.g. outside of a
+        request), the first family is returned.
+        """
+        if username is None:
+            return next(iter(self.families.values()))
+        return self.families[self.users[username].family]
+
+    def is_parent(self, username):
+        user = self.users.get(username)
+        return user is not None and user.role == 'parent'
+
+    def files(self):
+        """Data set name -> file, for all the children and parents."""
+        return {person.key: person.file
+                for family in self.families.values()
+                for person in family.children + family.parents}
+
+    def parent_keys(self):
+        """The names of the parents' data sets."""
+        return [person.key for family in self.families.values()
+                for person in family.parents]
@@ -0,0 +1,228 @@
+"""
+Static growth reports: the dashboard's figures as standalone HTML files
+(and, with --json, their JSON figure specs), e.g. to bring to a
+pediatric visit or to send to relatives without a login.
+
+A figure is made for every child and preset (a set of checkboxes, see
+PRESETS) in every unit combination, with the same code as the dashboard
+(Gottenso.render_figure), spread over a pool of processes. The HTML
+files load plotly.js from a plotly.min.js written next to them.
+
+The output directory has a manifest.json with a hash of everything each
+file was made from: the contents of the data files it shows, its preset
+and units, the settings, the registry, the translations and the code.
+Files whose hash hasn't changed are not made again, so after a new data
+point only the figures of that child are.
+
+    python report.py reports/ --presets growth weight --json
+"""
+
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+PRESETS = {
+    'growth': ('gro_curves', 'show_ht', 'show_wt'),
+    'weight': ('gro_curves', 'show_wt'),
+    'height': ('gro_curves', 'show_ht'),
+    'recent': ('gro_curves', 'show_ht', 'show_wt', 'zoom'),
+    'parents': ('show_ht', 'show_wt', 'showp1', 'showp2'),
+}
+UNITS = [('g', 'days'), ('g', 'years'), ('kg', 'days'), ('kg', 'years')]
+
+MANIFEST = 'manifest.json'
+PLOTLYJS = 'plotly.min.js'
+# the modules whose code makes the figures: plotting, the reference
+# curves, reading the data (units, journals) and finding the families
+SOURCES = ('app.py', 'growth.py', 'report.py', 'storage.py', 'registry.py')
+
+_gottenso = None
+
+
+def file_hash(filename, digest=None):
+    """Add the contents of a file (nothing if it's missing) to digest."""
+    digest = digest or hashlib.sha256()
+    try:
+        with open(filename, 'rb') as datafile:
+            for block in iter(lambda: datafile.read(1 << 20), b''):
+                digest.update(block)
+    except FileNotFoundError:
+        digest.update(b'missing')
+    return digest
+
+
+def data_hashes(gottenso):
+    """A hash of the stored contents of every data set, by name."""
+    import storage
+
+    store = gottenso.store
+    hashes = {}
+    for name in list(gottenso.registry.files()) + ['gro']:
+        if isinstance(store, storage.CsvStorage):
+            digest = file_hash(store.files[name])
+            file_hash(store.journal_file(name), digest)
+            hashes[name] = digest.hexdigest()
+        else:
+            hashes[name] = '%s:%s' % (store.dbfile, store.version(name))
+    return hashes
+
+
+def code_hash(settings):
+    """
+    A hash of the settings, of the code that makes the figures, of the
+    catalog of the language they are in, and of the registry.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True,
+                                       default=str).encode())
+    for source in SOURCES:
+        file_hash(os.path.join(root, source), digest)
+    file_hash(os.path.join(root, 'locales', settings['APPLANG'],
+                           'LC_MESSAGES', 'base.mo'), digest)
+    if settings['REGISTRY']:
+        file_hash(settings['REGISTRY'], digest)
+    return digest.hexdigest()
+
+
+def tasks(gottenso, presets, units, hashes, code):
+    """
+    Yield (filename, input hash, family, child key, checkboxes, weight
+    unit, age unit) for every figure of the report.
+    """
+    for family in gottenso.registry.families.values():
+        parents = [parent.key for parent in family.parents]
+        for child in family.children:
+            for preset in presets:
+                checkbox = PRESETS[preset]
+                shown = [child.key]
+                if 'gro_curves' in checkbox:
+                    shown.append('gro')
+                shown += [key for key, box in zip(parents,
+                                                  ('showp1', 'showp2'))
+                          if box in checkbox]
+                for weight_pref, age_pref in units:
+                    inputs = [code, preset, weight_pref, age_pref] + \
+                        [hashes[name] for name in shown]
+                    yield ('%s-%s-%s-%s' % (child.key, preset, weight_pref,
+                                            age_pref),
+                           hashlib.sha256('\n'.join(inputs).encode())
+                           .hexdigest(),
+                           family.name, child.key, checkbox, weight_pref,
+                           age_pref)
+
+
+def init_worker(settings):
+    """Make the Gottenso instance of a worker process."""
+    import app
+
+    global _gottenso
+    _gottenso = app.Gottenso(settings)
+
+
+def render(directory, task, write_json):
+    """Make the files of one figure; returns its name."""
+    import plotly.io as pio
+
+    name, _, family_name, child_key, checkbox, weight_pref, age_pref = task
+    gottenso = _gottenso
+    family = gottenso.registry.families[family_name]
+    figure = gottenso.render_figure(
+        checkbox, weight_pref, age_pref, family_name, (child_key,),
+        gottenso.data_version(family), gottenso.language)
+    html = pio.to_html(json.loads(figure), include_plotlyjs=PLOTLYJS,
+                       full_html=True, validate=False)
+    write_text(os.path.join(directory, name + '.html'), html)
+    if write_json:
+        write_text(os.path.join(directory, name + '.json'), figure)
+    return name
+
+
+def write_text(filename, text):
+    """Write a file via a temporary file and a rename."""
+    import storage
+
+    fd, tmpname = storage.open_temp(filename)
+    try:
+        with os.fdopen(fd, 'w') as tmpfile:
+            tmpfile.write(text)
+        storage.replace_file(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as manifest:
+            return json.load(manifest)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def make_report(directory, settings, presets=tuple(PRESETS), units=UNITS,
+                write_json=False, jobs=None):
+    """
+    Make the report in directory (see above). Returns the names of the
+    figures that were made, and of those that were up to date.
+    """
+    import plotly.offline
+
+    os.makedirs(directory, exist_ok=True)
+    init_worker(settings)
+    todo = []
+    current = []
+    manifest = read_manifest(directory)
+    new_manifest = {}
+    for task in tasks(_gottenso, presets, units, data_hashes(_gottenso),
+                      code_hash(settings)):
+        name, digest = task[:2]
+        new_manifest[name] = digest
+        outputs = [name + '.html'] + ([name + '.json'] if write_json else [])
+        if manifest.get(name) == digest and all(
+                os.path.exists(os.path.join(directory, output))
+                for output in outputs):
+            current.append(name)
+        else:
+            todo.append(task)
+    if not os.path.exists(os.path.join(directory, PLOTLYJS)):
+        write_text(os.path.join(directory, PLOTLYJS),
+                   plotly.offline.get_plotlyjs())
+    if jobs == 1 or len(todo) < 2:
+        made = [render(directory, task, write_json) for task in todo]
+    else:
+        with ProcessPoolExecutor(jobs, initializer=init_worker,
+                                 initargs=(settings,)) as pool:
+            made = list(pool.map(render, [directory] * len(todo), todo,
+                                 [write_json] * len(todo)))
+    _gottenso.access_log.close()
+    write_text(os.path.join(directory, MANIFEST),
+               json.dumps(new_manifest, indent=1, sort_keys=True))
+    return made, current
+
+
+if __name__ == '__main__':
+    import argparse
+    import app
+
+    parser = argparse.ArgumentParser(
+        description='Make static growth reports for every child.')
+    parser.add_argument('directory', help='where to write the report')
+    parser.add_argument('--presets', nargs='+', choices=list(PRESETS),
+                        default=list(PRESETS), help='the figures to make')
+    parser.add_argument('--units', nargs='+', default=None,
+                        choices=['%s-%s' % units for units in UNITS],
+                        help='the units to make them in (default: all)')
+    parser.add_argument('--json', action='store_true',
+                        help='also write the JSON figure specs')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='processes to use (default: one per CPU)')
+    args = parser.parse_args()
+
+    units = UNITS if args.units is None else \
+        [tuple(units.split('-')) for units in args.units]
+    made, current = make_report(args.directory, app.load_settings(),
+                                args.presets, units, args.json, args.jobs)
+    print('Made %d figures, %d were up to date' % (len(made), len(current)),
+          file=sys.stderr)
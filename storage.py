@@ -0,0 +1,667 @@
+"""
+Data access for the app.
+
+The data sets ('child', 'p1', 'p2' and 'gro') are stored either in the
+.csv files given in the settings (CsvStorage) or in an SQLite database
+(SqliteStorage). Both keep the loaded data in memory and key it on a
+version of the stored data: the identity of the file on disk (inode,
+size and modification time) for .csv files, and a counter that every
+write bumps for SQLite. Data is only read again when it has actually
+changed, no matter which process changed it, so the cache stays correct
+with several gunicorn workers.
+
+Writes to .csv files take an advisory lock on a .lock file next to the
+data file, so concurrent submits from several workers can't lose rows.
+
+Edits and deletions of rows (by age) are appended to a journal next to
+the .csv file, one small JSON line per change, and applied to the data
+when it's read. When the journal has grown to `journal_size` changes it's
+compacted: the .csv file is rewritten with them, and the journal removed.
+
+The read-only reference data sets (see `shared`) can instead be kept in
+an .npy file next to their data, with every numeric column as a float32
+array. It's memory-mapped when read, so all the workers share one copy
+of the data in the page cache rather than each keeping its own.
+
+Running this file copies the data between the .csv files and the
+database, e.g. `python storage.py import` to move to SQLite, or compacts
+the journals of the .csv files (`python storage.py compact`).
+"""
+
+import csv
+import fcntl
+import io
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import metrics
+
+VERSION_FIELD = '.version'
+CHUNK_ROWS = 100000
+
+
+def file_key(filename):
+    """
+    Return a key identifying the current version of a file,
+    or None if the file doesn't exist.
+    """
+    try:
+        stat = os.stat(filename)
+    except (FileNotFoundError, TypeError):
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+@contextmanager
+def locked(filename):
+    """Hold an exclusive lock for writing to filename."""
+    with open(filename + '.lock', 'a') as lockfile:
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+
+def read_header(filename):
+    """Return the column names of a .csv file ([] if it's missing/empty)."""
+    try:
+        with open(filename, newline='') as datafile:
+            return next(csv.reader(datafile), [])
+    except FileNotFoundError:
+        return []
+
+
+def encode_row(row, header):
+    """Encode a dict of column -> value as a .csv line, like to_csv does."""
+    line = io.StringIO()
+    csv.writer(line, lineterminator='\n').writerow(
+        ['' if pd.isna(row.get(col)) else row.get(col) for col in header])
+    return line.getvalue()
+
+
+def open_temp(filename):
+    """
+    Create a temporary file next to filename and return its file
+    descriptor and name. Unlike with mkstemp, which makes files only
+    their owner can read, the umask gives it the usual mode of a new file.
+    """
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    while True:
+        tmpname = os.path.join(dirname, '.%s.%s.tmp' % (
+            basename, os.urandom(6).hex()))
+        try:
+            return os.open(tmpname, os.O_CREAT | os.O_EXCL | os.O_WRONLY,
+                           0o666), tmpname
+        except FileExistsError:
+            continue
+
+
+def replace_file(tmpname, filename):
+    """
+    Rename a temporary file made by open_temp to filename, with the mode
+    filename had if it exists.
+    """
+    try:
+        os.chmod(tmpname, os.stat(filename).st_mode & 0o7777)
+    except FileNotFoundError:
+        pass
+    os.replace(tmpname, filename)
+
+
+def write_atomic(filename, data):
+    """
+    Write a dataframe to filename via a temporary file and a rename,
+    so that readers never see a half-written file.
+    """
+    fd, tmpname = open_temp(filename)
+    try:
+        with os.fdopen(fd, 'w', newline='') as tmpfile:
+            data.to_csv(tmpfile, index=False)
+        replace_file(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+
+def append_row(filename, row):
+    """Append a row (a dict of column -> value) to a .csv file."""
+    append_rows(filename, [row])
+
+
+def append_rows(filename, rows, sort_by=None):
+    """
+    Append rows (dicts of column -> value) to a .csv file, in one write.
+
+    If the file already has all of the rows' columns, only the new lines
+    are written. Otherwise the file is rewritten with the new columns
+    added (missing values are left empty). If sort_by is given and the
+    rows don't all come after the ones in the file, the file is also
+    rewritten, sorted by the column sort_by.
+    """
+    with locked(filename):
+        add_rows(filename, rows, sort_by)
+
+
+def add_rows(filename, rows, sort_by=None):
+    """Like append_rows, for a caller that holds the lock of filename."""
+    header = read_header(filename)
+    in_order = sort_by is None or not header or sort_by not in header \
+        or min(row[sort_by] for row in rows) >= \
+        read_columns(filename, [sort_by])[sort_by].max()
+    if header and in_order and set().union(*rows) <= set(header):
+        with open(filename, 'rb') as datafile:
+            datafile.seek(-1, os.SEEK_END)
+            newline = datafile.read(1) != b'\n'
+        with open(filename, 'a', newline='') as datafile:
+            datafile.write(('\n' if newline else '') + ''.join(
+                encode_row(row, header) for row in rows))
+    else:
+        data = pd.DataFrame(rows)
+        if header:
+            data = pd.concat([pd.read_csv(filename), data],
+                             ignore_index=True)
+        if sort_by is not None:
+            data = data.sort_values(sort_by, kind='stable',
+                                    ignore_index=True)
+        write_atomic(filename, data)
+
+
+def read_journal(filename):
+    """Return the changes in a journal file ([] if there is none)."""
+    try:
+        with open(filename) as journal:
+            return [json.loads(line) for line in journal if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def apply_journal(data, changes, agecol):
+    """
+    Apply changes ({'op': 'edit', 'age': ..., 'values': {col: value}} or
+    {'op': 'delete', 'age': ...}) to the rows of data with the given age
+    (the last one, if there are several), in place where possible.
+    Changes to ages that aren't in the data are ignored.
+    """
+    if not changes:
+        return data
+    index = row_index(data, agecol)
+    deleted = []
+    for change in changes:
+        row = index.get(change['age'])
+        if row is None:
+            continue
+        if change['op'] == 'delete':
+            deleted.append(data.index[row])
+            del index[change['age']]
+        else:
+            for col, value in change['values'].items():
+                data.loc[data.index[row], col] = value
+    return data.drop(deleted).reset_index(drop=True) if deleted else data
+
+
+def row_index(data, agecol):
+    """Age -> position of the (last) row with that age in data."""
+    return {age: row for row, age in enumerate(data[agecol])}
+
+
+def read_columns(source, columns, chunksize=CHUNK_ROWS):
+    """
+    Read the numeric columns given (those of them that exist) of a .csv
+    file, in chunks of chunksize rows, without inferring the types or
+    keeping the other columns in memory.
+    """
+    chunks = pd.read_csv(source, usecols=lambda col: col in columns,
+                         dtype='float64', chunksize=chunksize)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def write_arrays(filename, version, data):
+    """
+    Write the numeric columns of a dataframe to an .npy file as float32
+    arrays, along with the version of the data they were made from.
+    The columns are stored one after another, so that read_arrays can
+    map them as a single block.
+    """
+    data = data.select_dtypes('number')
+    version = np.atleast_1d(np.asarray(version, dtype='int64'))
+    dtype = np.dtype([(VERSION_FIELD, '<i8', version.shape)] +
+                     [(col, '<f4', (len(data),)) for col in data.columns])
+    arrays = np.zeros(1, dtype=dtype)
+    arrays[VERSION_FIELD][0] = version
+    for col in data.columns:
+        arrays[col][0] = data[col].to_numpy(dtype='float32')
+    fd, tmpname = open_temp(filename)
+    try:
+        with os.fdopen(fd, 'wb') as tmpfile:
+            np.save(tmpfile, arrays)
+        replace_file(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+
+def read_arrays(filename, version):
+    """
+    Memory-map an .npy file written by write_arrays and return it as a
+    (read-only) dataframe, or None if the file is missing or was made
+    from another version of the data. No data is copied.
+    """
+    try:
+        arrays = np.load(filename, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    names = arrays.dtype.names
+    if not names or names[0] != VERSION_FIELD or \
+            tuple(arrays[VERSION_FIELD][0]) != \
+            tuple(np.atleast_1d(version)):
+        return None
+    columns = list(names[1:])
+    if not columns:
+        return pd.DataFrame()
+    offset = arrays.dtype.fields[columns[0]][1]
+    rows = arrays.dtype.fields[columns[0]][0].shape[0]
+    values = arrays.view(np.uint8)[offset:].view('<f4').reshape(
+        len(columns), rows)
+    return pd.DataFrame(values.T, columns=columns, copy=False)
+
+
+def load_arrays(filename, version, load):
+    """
+    Return the data cached in the .npy file filename for version, or
+    call load() for it and cache it there (if the file can be written).
+    """
+    data = read_arrays(filename, version)
+    if data is None:
+        data = load()
+        try:
+            with locked(filename):
+                write_arrays(filename, version, data)
+        except OSError:
+            pass
+        else:
+            # another worker may have written a newer version since, and
+            # then the loaded data is used as it is
+            mapped = read_arrays(filename, version)
+            if mapped is not None:
+                data = mapped
+    return data
+
+
+class Storage:
+    """
+    Common part of the storage backends: caching of the loaded data.
+
+    Subclasses implement version(name), which returns None if the data
+    set doesn't exist, _load(name, below) and array_file(name), the .npy
+    file for the data sets in shared.
+
+    At most cache_size loaded data sets (or age ranges of them) are kept;
+    the least recently used one is dropped to make room for a new one.
+    """
+
+    def __init__(self, agecol, shared=(), cache_size=64):
+        self.agecol = agecol
+        self.shared = frozenset(shared)
+        self.cache_size = cache_size
+        # (name, convert, below) -> (version, data, row index or None)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def index(self, name):
+        """
+        Return a dict of age -> position of the (last) row with that age
+        in the data set name, built once per version of the data. It's
+        kept with the data in the cache, and dropped along with it.
+        """
+        data = self.read(name)
+        if data is None:
+            return {}
+        key = (name, None, None)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[1] is data and \
+                    cached[2] is not None:
+                return cached[2]
+        index = row_index(data, self.agecol)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[1] is data:
+                self._cache[key] = (cached[0], data, index)
+        return index
+
+    def read(self, name, convert=None, below=None):
+        """
+        Return the data set name as a dataframe, or None if it doesn't
+        exist. If below is given, only the rows with an age below it are
+        returned. The data is passed through convert(data), if given.
+
+        The result is cached until the stored data changes. It's shared
+        between callers and must not be modified in place.
+        """
+        version = self.version(name)
+        if version is None:
+            return None
+        key = (name, convert, below)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == version:
+                self._cache.move_to_end(key)
+                metrics.inc('gottenso_cache_total', cache='data',
+                            result='hit')
+                return cached[1]
+        metrics.inc('gottenso_cache_total', cache='data', result='miss')
+        # one label per kind of data set (child, p1, ...), not per child
+        with metrics.timer('read', data=name.split('-')[0]):
+            if name in self.shared:
+                data = self._read_shared(name, version, convert, below)
+            else:
+                data = self._load(name, below)
+                if convert is not None:
+                    data = convert(data)
+        with self._lock:
+            self._cache[key] = (version, data, None)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data
+
+    def _read_shared(self, name, version, convert, below):
+        # The data is converted once, by the worker that writes the .npy
+        # file, and the others map the result.
+        def load():
+            data = self._load(name, None)
+            return data if convert is None else convert(data)
+
+        data = load_arrays(self.array_file(name), version, load)
+        if below is not None:
+            ages = data[self.agecol]
+            if ages.is_monotonic_increasing:
+                # a slice is a view, so the rows stay shared
+                data = data.iloc[:ages.searchsorted(below)]
+            else:
+                data = data.loc[ages < below].copy()
+        return data
+
+
+class CsvStorage(Storage):
+    """
+    Data sets stored in .csv files; files maps names to filenames.
+    If columns is given, only those columns of the shared data sets are
+    read (see read_columns).
+    """
+
+    def __init__(self, files, agecol, shared=(), columns=None,
+                 cache_size=64, journal_size=100):
+        super().__init__(agecol, shared, cache_size)
+        self.files = files
+        self.columns = columns
+        self.journal_size = journal_size
+
+    def journal_file(self, name):
+        return self.files[name] + '.journal'
+
+    def version(self, name):
+        key = file_key(self.files[name])
+        journal = file_key(self.journal_file(name))
+        return key + journal if key and journal else key
+
+    def array_file(self, name):
+        return self.files[name] + '.npy'
+
+    def _load(self, name, below):
+        if name in self.shared and self.columns:
+            data = read_columns(self.files[name], self.columns)
+        else:
+            data = pd.read_csv(self.files[name])
+        data = apply_journal(data, read_journal(self.journal_file(name)),
+                             self.agecol)
+        if below is not None:
+            data = data.loc[data[self.agecol] < below].copy()
+        return data
+
+    def append(self, name, row):
+        """Append a row (a dict of column -> value) to a data set."""
+        self.extend(name, [row])
+
+    def extend(self, name, rows, sort_by=None):
+        """
+        Append rows (dicts of column -> value) to a data set in one write,
+        keeping it sorted by the column sort_by if given.
+        """
+        with locked(self.files[name]):
+            # the changes in the journal are to the rows there are now,
+            # not to new ones at the same age
+            self._compact(name)
+            add_rows(self.files[name], rows, sort_by)
+
+    def write(self, name, data):
+        """Replace a data set with the dataframe data."""
+        with locked(self.files[name]):
+            write_atomic(self.files[name], data)
+            self._remove_journal(name)
+
+    def edit(self, name, age, values):
+        """Set the values (a dict of column -> value) of the row at age."""
+        self._change(name, {'op': 'edit', 'age': age, 'values': values})
+
+    def delete(self, name, age):
+        """Delete the row at age."""
+        self._change(name, {'op': 'delete', 'age': age})
+
+    def compact(self, name):
+        """Rewrite the .csv file with the changes in the journal."""
+        with locked(self.files[name]):
+            self._compact(name)
+
+    def _change(self, name, change):
+        with locked(self.files[name]):
+            with open(self.journal_file(name), 'a') as journal:
+                # numpy numbers are written as the Python ones
+                journal.write(json.dumps(
+                    change, default=lambda value: value.item()) + '\n')
+            if len(read_journal(self.journal_file(name))) >= \
+                    self.journal_size:
+                self._compact(name)
+
+    def _compact(self, name):
+        changes = read_journal(self.journal_file(name))
+        if changes:
+            write_atomic(self.files[name], apply_journal(
+                pd.read_csv(self.files[name]), changes, self.agecol))
+        self._remove_journal(name)
+
+    def _remove_journal(self, name):
+        try:
+            os.remove(self.journal_file(name))
+        except FileNotFoundError:
+            pass
+
+
+class SqliteStorage(Storage):
+    """
+    Data sets stored as tables in an SQLite database, in WAL mode so
+    that readers in other workers don't block the writer. Each table has
+    an index on the age column for the range queries of read(below=...).
+    """
+
+    def __init__(self, dbfile, agecol, shared=(), cache_size=64):
+        super().__init__(agecol, shared, cache_size)
+        self.dbfile = dbfile
+        self._local = threading.local()
+
+    def array_file(self, name):
+        return self.dbfile + '.' + name + '.npy'
+
+    def connection(self):
+        """Return a connection for the current thread and process."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.dbfile, timeout=30,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS versions '
+                         '(name TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def version(self, name):
+        row = self.connection().execute(
+            'SELECT version FROM versions WHERE name = ?', (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def _load(self, name, below):
+        query = 'SELECT * FROM "%s"' % name
+        params = ()
+        if below is not None:
+            query += ' WHERE "%s" < ?' % self.agecol
+            params = (below,)
+        return pd.read_sql_query(query + ' ORDER BY rowid',
+                                 self.connection(), params=params)
+
+    def _columns(self, conn, name):
+        return [row[1] for row in
+                conn.execute('PRAGMA table_info("%s")' % name)]
+
+    def _insert(self, conn, name, data):
+        columns = ', '.join('"%s"' % col for col in data.columns)
+        marks = ', '.join('?' * len(data.columns))
+        rows = data.astype(object).where(data.notna(), None)
+        conn.executemany(
+            'INSERT INTO "%s" (%s) VALUES (%s)' % (name, columns, marks),
+            rows.itertuples(index=False, name=None))
+        conn.execute('INSERT INTO versions VALUES (?, 1) ON CONFLICT(name) '
+                     'DO UPDATE SET version = version + 1', (name,))
+
+    def _create(self, conn, name, columns):
+        conn.execute('CREATE TABLE "%s" (%s)' % (
+            name, ', '.join('"%s"' % col for col in columns)))
+        if self.agecol in columns:
+            conn.execute('CREATE INDEX "%s_age" ON "%s" ("%s")' % (
+                name, name, self.agecol))
+
+    def append(self, name, row):
+        """Append a row (a dict of column -> value) to a data set."""
+        self.extend(name, [row])
+
+    def extend(self, name, rows, sort_by=None):
+        """
+        Append rows (dicts of column -> value) to a data set in one
+        transaction, keeping it sorted by the column sort_by if given.
+        """
+        data = pd.DataFrame(rows)
+        with self.transaction() as conn:
+            columns = self._columns(conn, name)
+            if not columns:
+                self._create(conn, name, data.columns)
+            for col in data.columns:
+                if columns and col not in columns:
+                    conn.execute('ALTER TABLE "%s" ADD COLUMN "%s"' % (
+                        name, col))
+            if columns and sort_by in columns:
+                last = conn.execute('SELECT MAX("%s") FROM "%s"' % (
+                    sort_by, name)).fetchone()[0]
+                if last is not None and data[sort_by].min() < last:
+                    # rowid is the order of the rows, so rewrite them all
+                    data = pd.concat([pd.read_sql_query(
+                        'SELECT * FROM "%s" ORDER BY rowid' % name, conn),
+                        data], ignore_index=True).sort_values(
+                        sort_by, kind='stable', ignore_index=True)
+                    conn.execute('DELETE FROM "%s"' % name)
+            self._insert(conn, name, data)
+
+    def write(self, name, data):
+        """Replace a data set with the dataframe data."""
+        with self.transaction() as conn:
+            conn.execute('DROP TABLE IF EXISTS "%s"' % name)
+            self._create(conn, name, data.columns)
+            self._insert(conn, name, data)
+
+    def edit(self, name, age, values):
+        """Set the values (a dict of column -> value) of the row at age."""
+        with self.transaction() as conn:
+            columns = self._columns(conn, name)
+            for col in values:
+                if col not in columns:
+                    conn.execute('ALTER TABLE "%s" ADD COLUMN "%s"' % (
+                        name, col))
+            self._change_last(conn, name, 'UPDATE "%s" SET %s' % (
+                name, ', '.join('"%s" = ?' % col for col in values)),
+                list(values.values()), age)
+
+    def delete(self, name, age):
+        """Delete the row at age."""
+        with self.transaction() as conn:
+            self._change_last(conn, name, 'DELETE FROM "%s"' % name, [], age)
+
+    def _change_last(self, conn, name, statement, params, age):
+        # like the journal of CsvStorage, change the last row at age
+        conn.execute(statement + ' WHERE rowid = (SELECT MAX(rowid) FROM '
+                     '"%s" WHERE "%s" = ?)' % (name, self.agecol),
+                     params + [age])
+        conn.execute('UPDATE versions SET version = version + 1 '
+                     'WHERE name = ?', (name,))
+
+
+if __name__ == '__main__':
+    import argparse
+    from decouple import config
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(
+        description='Copy the data between the .csv files and the '
+                    'SQLite database, or compact the journals of the '
+                    '.csv files.')
+    parser.add_argument('direction', choices=['import', 'export',
+                                              'compact'],
+                        help='import: from the .csv files to the database, '
+                             'export: from the database to the .csv files, '
+                             'compact: apply the journals to the .csv files')
+    args = parser.parse_args()
+
+    load_dotenv()
+    agecol = config('AGECOL')
+    if config('REGISTRY', default=''):
+        import registry
+        files = registry.Registry.from_file(config('REGISTRY')).files()
+    else:
+        files = {'child': config('CFILE'), 'p1': config('P1FILE'),
+                 'p2': config('P2FILE')}
+    files['gro'] = config('GROFILE')
+    csv_storage = CsvStorage(files, agecol)
+    if args.direction == 'compact':
+        for name in files:
+            if os.path.exists(csv_storage.journal_file(name)):
+                csv_storage.compact(name)
+                print('Compacted ' + name)
+        raise SystemExit
+    db_storage = SqliteStorage(
+        config('DBFILE', default='data/gottenso.db'), agecol)
+    if args.direction == 'import':
+        source, target = csv_storage, db_storage
+    else:
+        source, target = db_storage, csv_storage
+    for name in files:
+        data = source.read(name)
+        if data is None:
+            print('No data for ' + name + ', skipping')
+        else:
+            target.write(name, data)
+            print('Copied ' + str(len(data)) + ' rows for ' + name)
@@ -0,0 +1,34 @@
+import os
+import accesslog
+
+
+class TestAccessLog:
+    def test_log(self, tmp_path):
+        fn = str(tmp_path / 'aux' / 'logfile.txt')
+        log = accesslog.AccessLog(fn, interval=0.01)
+        log.log('Server rebooted')
+        log.log('Connection by family')
+        log.close()
+        with open(fn) as logfile:
+            lines = logfile.readlines()
+        assert len(lines) == 2
+        assert lines[1].endswith(' Connection by family\n')
+
+    def test_no_truncation(self, tmp_path):
+        fn = str(tmp_path / 'logfile.txt')
+        for i in range(2):
+            log = accesslog.AccessLog(fn, interval=0.01)
+            log.log('Server rebooted')
+            log.close()
+        with open(fn) as logfile:
+            assert len(logfile.readlines()) == 2
+
+    def test_rotation(self, tmp_path):
+        fn = str(tmp_path / 'logfile.txt')
+        log = accesslog.AccessLog(fn, max_bytes=10, backups=2, interval=0)
+        for i in range(4):
+            log.log('Connection by parent')
+            log.close()
+        assert os.path.exists(fn + '.1')
+        assert os.path.exists(fn + '.2')
+        assert not os.path.exists(fn + '.3')
@@ -1,8 +1,44 @@
 import pytest
 import setup
 import app
+import numpy as np
 import pandas as pd
+import base64
+import datetime as dt
 import io
+import json
+import os
+import shutil
+
+
+def example_files(tmp_path):
+    """
+    Copies of the example data in tmp_path, so the tests leave no files
+    (or .npy and .lock files) next to it; there is no second parent file.
+    """
+    settings = app.default_settings()
+    files = {}
+    for key in ('CFILE', 'P1FILE'):
+        files[key] = str(tmp_path / os.path.basename(settings[key]))
+        shutil.copy(settings[key], files[key])
+    files['P2FILE'] = str(tmp_path / 'p2_data.csv')
+    files['LOGFILE'] = str(tmp_path / 'log.txt')
+    return files
+
+
+@pytest.fixture(autouse=True)
+def parent_files(tmp_path, monkeypatch):
+    # for the apps that only override some of the settings
+    files = example_files(tmp_path)
+    for key in ('P1FILE', 'P2FILE'):
+        monkeypatch.setenv(key, files[key])
+
+
+@pytest.fixture(scope='module')
+def gottenso(tmp_path_factory):
+    dash_app = app.create_app(example_files(tmp_path_factory.mktemp('data')))
+    yield dash_app.gottenso
+    dash_app.gottenso.access_log.close()
 
 
 class TestLoadDataFiles:
@@ -14,7 +50,10 @@ class TestLoadDataFiles:
         loaded_data = app.load_datafile(io.StringIO(good_data))
         good_df = pd.read_csv(io.StringIO(good_data))
         print(loaded_data)
-        assert loaded_data.equals(good_df)
+        good_df = good_df[loaded_data.columns]
+        pd.testing.assert_frame_equal(loaded_data, good_df,
+                                      check_dtype=False)
+        assert 'Unnamed: 0' not in loaded_data
 
     def test_load_m_data(self):
         m_data = """,Age,Height,Weight
@@ -27,6 +66,7 @@ class TestLoadDataFiles:
         2,12,59,3700"""
         loaded_data = app.load_datafile(io.StringIO(m_data))
         good_df = pd.read_csv(io.StringIO(good_data))
+        good_df = good_df[loaded_data.columns]
         pd.testing.assert_frame_equal(loaded_data, good_df,
                                       check_dtype=False)
 
@@ -41,6 +81,7 @@ class TestLoadDataFiles:
         2,12,59,3700"""
         loaded_data = app.load_datafile(io.StringIO(kg_data))
         good_df = pd.read_csv(io.StringIO(good_data))
+        good_df = good_df[loaded_data.columns]
         pd.testing.assert_frame_equal(loaded_data, good_df,
                                       check_dtype=False)
 
@@ -55,9 +96,22 @@ class TestLoadDataFiles:
         2,12,59,3700,1.8,100"""
         loaded_data = app.load_datafile(io.StringIO(kg_data))
         good_df = pd.read_csv(io.StringIO(good_data))
+        good_df = good_df[loaded_data.columns]
         pd.testing.assert_frame_equal(loaded_data, good_df,
                                       check_dtype=False)
 
+    def test_cached_file(self, tmp_path):
+        fn = str(tmp_path / 'curves.csv')
+        pd.DataFrame({'Age': [0, 6], 'Height': [0.53, 0.55],
+                      'Weight': [3.5, 3.6], 'Sex': ['F', 'F']}).to_csv(
+            fn, index=False)
+        first = app.load_datafile(fn)
+        assert os.path.exists(fn + '.npy')
+        second = app.load_datafile(fn)
+        assert list(second.columns) == ['Age', 'Height', 'Weight']
+        pd.testing.assert_frame_equal(first, second)
+        assert list(second['Weight']) == [3500, 3600]
+
     def test_wrong_file(self):
         fn = 'completely_stupid_wrong_name.sit'
         assert app.load_datafile(fn) is None
@@ -79,3 +133,454 @@ class TestCalcWeight():
 
     def test_years(self):
         assert app.calc_weight(3900, disp='kg') == pytest.approx(3.9)
+
+
+class TestHoverData():
+
+    def test_child(self, gottenso):
+        data = pd.DataFrame({'Age': [0, 31],
+                             'Comment': pd.Series(['Born', None]).convert_dtypes()})
+        birth = dt.datetime(2021, 1, 1)
+        text, customdata = gottenso.hover_data('test', data, birth)
+        assert list(text) == ['2021-01-01', '2021-02-01']
+        assert list(customdata) == ['', '']
+        assert gottenso.hover_data('test', data, birth)[0] is text
+
+    def test_comments(self, gottenso):
+        data = pd.DataFrame({'Age': [0, 31],
+                             'Comment': pd.Series(['Born', None]).convert_dtypes()})
+        birth = dt.datetime(2021, 1, 1)
+        customdata = gottenso.hover_data('child', data, birth, comments=True)[1]
+        assert list(customdata) == ['<br>Born', '']
+
+
+class TestUpdateFigure():
+
+    def test_cache(self, gottenso):
+        checks = ['show_wt', 'show_ht', 'zoom']
+        first = gottenso.update_figure(checks, 0, 'g', 'days')
+        hits = gottenso.render_figure.cache_info().hits
+        second = gottenso.update_figure(checks[::-1], 0, 'g', 'days')
+        assert gottenso.render_figure.cache_info().hits == hits + 1
+        assert first == second
+
+
+class TestHotReload():
+
+    def test_new_parent_file(self, gottenso):
+        p2file = gottenso.store.files['p2']
+        assert not os.path.exists(p2file)
+        labels = gottenso.serve_layout().children[1].children[0].options
+        assert 'ERROR' in labels[4]['label']
+        pd.DataFrame({'Age': [0, 6], 'Height': [50, 53],
+                      'Weight': [3.2, 3.4]}).to_csv(p2file, index=False)
+        try:
+            labels = gottenso.serve_layout().children[1].children[0].options
+            assert 'ERROR' not in labels[4]['label']
+            weights = gottenso.reference_data('p2')['Weight']
+            assert list(weights) == [3200, 3400]
+        finally:
+            os.remove(p2file)
+        assert gottenso.reference_data('p2') is None
+
+
+class TestFamilies():
+
+    @pytest.fixture
+    def families(self, tmp_path):
+        for name in ('charlie', 'dana', 'eve'):
+            pd.DataFrame({'Age': [0, 10], 'Weight': [3500, 3900],
+                          'Height': [50, 52], 'Comment': ['', ''],
+                          'Date': ['', '']}).to_csv(
+                tmp_path / (name + '.csv'), index=False)
+
+        def family(children, user, role):
+            return {'children': [{'name': name.title(),
+                                  'birthday': '20210101',
+                                  'file': str(tmp_path / (name + '.csv'))}
+                                 for name in children],
+                    'users': {user: {'password': 'pw', 'role': role}}}
+
+        fn = str(tmp_path / 'registry.json')
+        with open(fn, 'w') as regfile:
+            json.dump({'families': {
+                'smith': family(['charlie', 'dana'], 'alice', 'parent'),
+                'jones': family(['eve'], 'gran', 'family')}}, regfile)
+        dash_app = app.create_app({'REGISTRY': fn,
+                                   'LOGFILE': str(tmp_path / 'log.txt')})
+        yield dash_app
+        dash_app.gottenso.access_log.close()
+
+    def figure(self, dash_app, user, children=None):
+        auth = base64.b64encode((user + ':pw').encode()).decode()
+        with dash_app.server.test_request_context(
+                headers={'Authorization': 'Basic ' + auth}):
+            return dash_app.gottenso.update_figure(
+                ['show_wt', 'zoom'], 0, 'g', 'days', children)
+
+    def test_siblings(self, families):
+        names = [trace['name'] for trace in
+                 self.figure(families, 'alice')['data']]
+        assert names == ['C weight', 'D weight']
+        names = [trace['name'] for trace in
+                 self.figure(families, 'alice', ['child-smith-1'])['data']]
+        assert names == ['D weight']
+
+    def test_other_family(self, families):
+        figure = self.figure(families, 'gran', ['child-smith-0'])
+        assert figure['data'] == []
+        names = [trace['name'] for trace in
+                 self.figure(families, 'gran')['data']]
+        assert names == ['E weight']
+
+    def test_family_cannot_add(self, families):
+        from dash.exceptions import PreventUpdate
+
+        auth = base64.b64encode(b'gran:pw').decode()
+        with families.server.test_request_context(
+                headers={'Authorization': 'Basic ' + auth}):
+            with pytest.raises(PreventUpdate):
+                families.gottenso.new_datapoint(
+                    1, 0, '2021-01-05', '3600', '', '', '', 'child-jones-0')
+
+    def test_import(self, families, tmp_path):
+        client = families.server.test_client()
+
+        def upload(user, child):
+            auth = base64.b64encode((user + ':pw').encode()).decode()
+            return client.post(
+                '/import', headers={'Authorization': 'Basic ' + auth},
+                data={'child': child, 'columns': '{"Weight": "kg"}',
+                      'file': (io.BytesIO(b'Date,kg\n2021-01-21,4.1\n'
+                                          b'2021-01-31,4.3\n'),
+                               'export.csv')})
+
+        assert upload('gran', 'child-jones-0').status_code == 401
+        assert upload('alice', 'child-jones-0').status_code == 404
+        response = upload('alice', 'child-smith-1')
+        assert response.get_json() == {'added': 2, 'duplicates': 0,
+                                       'invalid': 0}
+        data = pd.read_csv(tmp_path / 'dana.csv')
+        assert list(data['Weight']) == [3500, 3900, 4100, 4300]
+        assert upload('alice', 'child-smith-1').get_json()[
+            'duplicates'] == 2
+
+    def test_edit_delete(self, families, tmp_path):
+        auth = base64.b64encode(b'alice:pw').decode()
+        gottenso = families.gottenso
+        with families.server.test_request_context(
+                headers={'Authorization': 'Basic ' + auth}):
+            assert gottenso.edit_datapoint('2021-01-11', {'Weight': 4000},
+                                           'child-smith-1')
+            assert not gottenso.delete_datapoint('2021-01-12',
+                                                 'child-smith-1')
+            assert gottenso.delete_datapoint('2021-01-01', 'child-smith-1')
+            figure = gottenso.update_figure(['show_wt'], 0, 'g', 'days')
+        weights = [trace['y'] for trace in figure['data']]
+        assert weights == [[3500, 3900], [4000]]
+        assert list(pd.read_csv(tmp_path / 'dana.csv')['Weight']) == [
+            3500, 3900]
+
+    def test_delete_and_resubmit(self, families, tmp_path):
+        auth = base64.b64encode(b'alice:pw').decode()
+        gottenso = families.gottenso
+        with families.server.test_request_context(
+                headers={'Authorization': 'Basic ' + auth}):
+            assert gottenso.delete_datapoint('2021-01-11', 'child-smith-0')
+            gottenso.new_datapoint(1, 0, '2021-01-11', '3950', '', '', '',
+                                   'child-smith-0')
+        data = gottenso.store.read('child-smith-0')
+        assert list(data['Age']) == [0, 10]
+        assert list(data['Weight']) == [3500, 3950]
+
+    def test_change_buttons(self, families, tmp_path):
+        client = families.server.test_client()
+        auth = base64.b64encode(b'alice:pw').decode()
+        states = [{'id': 'numchanges', 'property': 'children', 'value': 0},
+                  {'id': 'setdate', 'property': 'date',
+                   'value': '2021-01-11'}] + [
+            {'id': field, 'property': 'value', 'value': value}
+            for field, value in (('new_weight', '4000'), ('new_height', None),
+                                 ('new_head', None), ('new_comment', None),
+                                 ('setchild', 'child-smith-0'))]
+
+        def click(button):
+            return client.post('/_dash-update-component', headers={
+                'Authorization': 'Basic ' + auth}, json={
+                'output': 'numchanges.children',
+                'outputs': {'id': 'numchanges', 'property': 'children'},
+                'inputs': [{'id': name, 'property': 'n_clicks',
+                            'value': int(name == button)}
+                           for name in ('edit-button', 'delete-button')],
+                'state': states,
+                'changedPropIds': [button + '.n_clicks']})
+
+        assert click('edit-button').status_code == 200
+        assert list(families.gottenso.store.read('child-smith-0')[
+            'Weight']) == [3500, 4000]
+        assert click('delete-button').status_code == 200
+        assert list(families.gottenso.store.read('child-smith-0')[
+            'Age']) == [0]
+
+
+class TestScores():
+
+    def test_incremental(self, tmp_path, monkeypatch):
+        import growth
+
+        cfile = str(tmp_path / 'child.csv')
+        grofile = str(tmp_path / 'gro.csv')
+        pd.DataFrame({'Age': [0, 10], 'Weight': [3500, 4000],
+                      'Height': [50, 52], 'Comment': ['', '']}).to_csv(
+            cfile, index=False)
+        pd.DataFrame({'Age': [0, 20], 'Weight': [3.5, 4.1],
+                      'Height': [50, 54], 'sd_wt': [0.5, 0.5],
+                      'sd_ht': [2, 2]}).to_csv(grofile, index=False)
+        dash_app = app.create_app({'CFILE': cfile, 'GROFILE': grofile,
+                                   'LOGFILE': str(tmp_path / 'log.txt')})
+        gottenso = dash_app.gottenso
+        scored = []
+        z_scores = growth.Reference.z_scores
+        monkeypatch.setattr(growth.Reference, 'z_scores',
+                            lambda ref, ages, values: scored.append(
+                                len(ages)) or z_scores(ref, ages, values))
+
+        data = gottenso.store.read('child', gottenso.convert_comments)
+        (z_wt, wt_text), (z_ht, ht_text) = gottenso.child_scores('child',
+                                                                 data)
+        assert z_wt == pytest.approx([0, 0.4])
+        assert z_ht == pytest.approx([0, 0])
+        assert 'percentile 50.0' in wt_text[0]
+
+        gottenso.new_datapoint(1, 0, '2021-01-21', '4100', '54', '', '')
+        data = gottenso.store.read('child', gottenso.convert_comments)
+        z_wt = gottenso.child_scores('child', data)[0][0]
+        assert z_wt == pytest.approx([0, 0.4, 0])
+        assert scored == [2, 2, 1, 1]
+
+        derived = gottenso.derived_metrics('child', data)
+        assert derived['wt_velocity'][1:] == pytest.approx([350, 70])
+        assert '+70 g/week' in derived['wt_text'][2]
+
+        # the velocity of a new row is from the last one before it
+        gottenso.new_datapoint(2, 1, '2021-01-31', '4450', '', '', '')
+        data = gottenso.store.read('child', gottenso.convert_comments)
+        velocities = []
+        velocity = growth.velocity
+        monkeypatch.setattr(growth, 'velocity',
+                            lambda ages, *args: velocities.append(
+                                len(ages)) or velocity(ages, *args))
+        derived = gottenso.derived_metrics('child', data)
+        assert velocities == [1, 1]
+        assert derived['wt_velocity'][3] == pytest.approx(245)
+        assert np.isnan(derived['ht_velocity'][3])
+        assert derived['ht_velocity'][2] == pytest.approx(
+            2 / 10 * 30.4375)
+        figure = gottenso.update_figure(['show_wt'], 0, 'g', 'days',
+                                        derived='bmi')
+        assert [trace['meta'] for trace in figure['data']] == [
+            ['child', 'wt'], ['child', 'bmi']]
+        assert figure['layout']['yaxis3']['overlaying'] == 'y'
+
+        # read again without new rows (e.g. after a change in the journal)
+        data = data.copy()
+        z_wt, wt_text = gottenso.child_scores('child', data)[0]
+        assert len(wt_text) == 4
+        gottenso.access_log.close()
+
+    def test_comment_edit(self, tmp_path):
+        cfile = str(tmp_path / 'child.csv')
+        pd.DataFrame({'Age': [0, 10], 'Weight': [3500, 4000],
+                      'Height': [50, 52], 'Comment': ['', '']}).to_csv(
+            cfile, index=False)
+        dash_app = app.create_app({'CFILE': cfile,
+                                   'LOGFILE': str(tmp_path / 'log.txt')})
+        gottenso = dash_app.gottenso
+        assert len(gottenso.score_text(np.array([]))) == 0
+        gottenso.update_figure(['show_wt', 'gro_curves'], 0, 'g', 'days')
+        # the same rows, so there are no new ones to score
+        assert gottenso.edit_datapoint('2021-01-11', {'Comment': 'Teeth'})
+        fig = gottenso.update_figure(['show_wt', 'gro_curves'], 0, 'g',
+                                     'days', num_changes=1)
+        child = [trace for trace in fig['data']
+                 if trace['meta'] == ['child', 'wt']][0]
+        assert len(child['customdata']) == 2
+        assert child['customdata'][1].endswith('<br>Teeth')
+        gottenso.access_log.close()
+
+    def test_bands(self, tmp_path):
+        grofile = str(tmp_path / 'gro.csv')
+        pd.DataFrame({'Age': [0, 10, 20], 'Weight': [3.5, 3.8, 4.1],
+                      'Height': [50, 52, 54], 'sd_wt': [0.5, 0.5, 0.5],
+                      'sd_ht': [2, 2, 2]}).to_csv(grofile, index=False)
+        dash_app = app.create_app({'GROFILE': grofile,
+                                   'GROWTH_BANDS': ['1', '3%'],
+                                   'LOGFILE': str(tmp_path / 'log.txt')})
+        gottenso = dash_app.gottenso
+        assert [label for label, z in gottenso.bands] == [
+            'P3-P97', '\u00b1 1 SD']
+        fig = gottenso.update_figure(
+            ['gro_curves', 'show_wt', 'show_ht'], 0, 'kg', 'days')
+        gro = [trace for trace in fig['data'] if trace['meta'][0] == 'gro']
+        # two bands and the average per measure
+        assert len(gro) == 6
+        band = gro[1]
+        assert band['fill'] == 'toself'
+        assert band['x'] == [0, 10, 20, 20, 10, 0]
+        assert band['y'] == pytest.approx([4, 4.3, 4.6, 3.6, 3.3, 3])
+        assert gro[2]['y'] == pytest.approx([3.5, 3.8, 4.1])
+        # heights stay in cm
+        assert gro[4]['y'] == pytest.approx([52, 54, 56, 52, 50, 48])
+        assert gro[5]['y'] == pytest.approx([50, 52, 54])
+        gottenso.access_log.close()
+
+    def test_lms_only(self, tmp_path):
+        # a WHO-style table, in kg and m, without the mean columns
+        grofile = str(tmp_path / 'gro.csv')
+        pd.DataFrame({'Age': [0, 10, 20], 'L_wt': [0.35, 0.3, 0.25],
+                      'M_wt': [3.5, 3.8, 4.1], 'S_wt': [0.14, 0.13, 0.13],
+                      'L_ht': [1, 1, 1], 'M_ht': [0.5, 0.52, 0.54],
+                      'S_ht': [0.04, 0.04, 0.04]}).to_csv(grofile,
+                                                          index=False)
+        cfile = str(tmp_path / 'child.csv')
+        pd.DataFrame({'Age': [10], 'Weight': [3800], 'Height': [52],
+                      'Comment': ['']}).to_csv(cfile, index=False)
+        dash_app = app.create_app({'GROFILE': grofile, 'CFILE': cfile,
+                                   'LOGFILE': str(tmp_path / 'log.txt')})
+        gottenso = dash_app.gottenso
+        layout = gottenso.serve_layout()
+        assert 'ERROR' not in \
+            layout.children[1].children[0].options[2]['label']
+        fig = gottenso.update_figure(
+            ['gro_curves', 'show_wt', 'show_ht'], 0, 'g', 'days')
+        means = [trace['y'] for trace in fig['data']
+                 if trace['meta'][0] == 'gro' and 'fill' not in trace]
+        assert means[0] == pytest.approx([3500, 3800, 4100])
+        assert means[1] == pytest.approx([50, 52, 54])
+        data = gottenso.store.read('child', gottenso.convert_comments)
+        (z_wt, _), (z_ht, _) = gottenso.child_scores('child', data)
+        assert z_wt[0] == pytest.approx(0) and z_ht[0] == pytest.approx(0)
+        gottenso.access_log.close()
+
+
+class TestVersion():
+
+    def test_etag(self, tmp_path):
+        cfile = str(tmp_path / 'child.csv')
+        pd.DataFrame({'Age': [0], 'Weight': [3500], 'Height': [50],
+                      'Comment': ['']}).to_csv(cfile, index=False)
+        dash_app = app.create_app({'CFILE': cfile,
+                                   'LOGFILE': str(tmp_path / 'log.txt')})
+        gottenso = dash_app.gottenso
+        client = dash_app.server.test_client()
+        auth = {'Authorization': 'Basic ' +
+                base64.b64encode(b'family:braggingrights').decode()}
+        response = client.get('/version', headers=auth)
+        assert response.status_code == 200
+        tag = response.headers['ETag']
+        response = client.get('/version',
+                              headers=dict(auth, **{'If-None-Match': tag}))
+        assert response.status_code == 304
+        assert response.data == b''
+
+        gottenso.new_datapoint(1, 0, '2021-01-11', '3900', '', '', '')
+        gottenso._version_tags.clear()
+        response = client.get('/version',
+                              headers=dict(auth, **{'If-None-Match': tag}))
+        assert response.status_code == 200
+        assert response.headers['ETag'] != tag
+        gottenso.access_log.close()
+
+
+class TestLanguages():
+
+    def test_accept_language(self, gottenso):
+        import flask
+
+        def request(language):
+            with flask.Flask(__name__).test_request_context(
+                    headers={'Accept-Language': language}):
+                figure = gottenso.update_figure(['show_wt'], 0, 'g', 'days')
+                return (figure['layout']['xaxis']['title']['text'],
+                        gottenso.serve_layout())
+
+        title, layout = request('sv-SE,sv;q=0.9,en;q=0.8')
+        assert title == '<b>Ålder</b> (dagar)'
+        assert layout.children[1].children[0].options[0]['label'] == \
+            'Visa vikt'
+        # made once per language
+        assert request('sv')[1] is layout
+        title, layout = request('de-DE')
+        assert title == '<b>Age</b> (days)'
+        assert layout.children[1].children[0].options[0]['label'] == \
+            'Plot weight'
+        assert gottenso.current_language() == 'en'
+
+    def test_user_language(self, tmp_path):
+        fn = str(tmp_path / 'registry.json')
+        with open(fn, 'w') as regfile:
+            json.dump({'families': {'smith': {
+                'children': [{'name': 'Charlie', 'birthday': '20210101',
+                              'file': str(tmp_path / 'charlie.csv')}],
+                'users': {'alice': {'password': 'pw', 'role': 'parent'},
+                          'gran': {'password': 'pw', 'role': 'family',
+                                   'language': 'se'}}}}}, regfile)
+        dash_app = app.create_app({'REGISTRY': fn, 'LANGUAGES': ['en', 'se'],
+                                   'LOGFILE': str(tmp_path / 'log.txt')})
+        gottenso = dash_app.gottenso
+        for user, language in (('alice', 'en'), ('gran', 'se')):
+            auth = base64.b64encode((user + ':pw').encode()).decode()
+            with dash_app.server.test_request_context(headers={
+                    'Authorization': 'Basic ' + auth,
+                    'Accept-Language': 'en'}):
+                assert gottenso.current_language() == language
+        gottenso.access_log.close()
+
+    def test_score_texts(self, tmp_path):
+        cfile = str(tmp_path / 'child.csv')
+        pd.DataFrame({'Age': [0, 10], 'Weight': [3500, 4200],
+                      'Height': [50, 51], 'Comment': ['', '']}).to_csv(
+            cfile, index=False)
+        gfile = str(tmp_path / 'gro.csv')
+        pd.DataFrame({'Age': [0, 10, 20], 'Weight': [3500, 3800, 4100],
+                      'Height': [50, 51, 52], 'SD_wt': [500] * 3,
+                      'SD_ht': [2] * 3}).to_csv(gfile, index=False)
+        gottenso = app.Gottenso(app.load_settings({
+            'CFILE': cfile, 'GROFILE': gfile, 'SDWTCOL': 'SD_wt',
+            'SDHTCOL': 'SD_ht', 'LOGFILE': str(tmp_path / 'log.txt')}))
+        data = gottenso.store.read('child', gottenso.convert_comments)
+        (z_en, text_en), _ = gottenso.child_scores('child', data, 'en')
+        (z_se, text_se), _ = gottenso.child_scores('child', data, 'se')
+        # the scores are shared between the languages
+        assert z_se is z_en
+        assert text_en[1].startswith('<b>z-score</b>: +0.80')
+        assert text_se[1].startswith('<b>SDS</b>: +0.80')
+        derived = gottenso.derived_metrics('child', data, 'se')
+        assert derived['wt_text'][1].startswith('<br><b>Ökning</b>')
+
+        # new rows are added to the texts of both languages
+        gottenso.new_datapoint(1, 0, '2021-01-21', '4500', '', '', '')
+        data = gottenso.store.read('child', gottenso.convert_comments)
+        assert len(gottenso.child_scores('child', data, 'se')[0][1]) == 3
+        assert gottenso.child_scores('child', data, 'en')[0][1][2] \
+            .startswith('<b>z-score</b>: +0.80')
+        gottenso.access_log.close()
+
+
+class TestMetricsPage():
+
+    def test_one_app(self, tmp_path):
+        apps = [app.create_app({'LOGFILE': str(tmp_path / 'log.txt'),
+                                'SLOW_CALLBACK_MS': slow_ms})
+                for slow_ms in (0, 1000)]
+        auth = {'Authorization': 'Basic ' +
+                base64.b64encode(b'parent:keep_track').decode()}
+        text = apps[0].server.test_client().get(
+            '/metrics', headers=auth).get_data(as_text=True)
+        # only this app's figure cache, once
+        assert text.count('gottenso_cache_total{cache="figure",'
+                          'result="hit"}') == 1
+        assert [dash_app.gottenso.profiling['slow_ms']
+                for dash_app in apps] == [0, 1000]
+        for dash_app in apps:
+            dash_app.gottenso.access_log.close()
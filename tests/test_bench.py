@@ -0,0 +1,20 @@
+import json
+import os
+import subprocess
+import sys
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'benchmarks', 'bench.py')
+
+
+def test_run():
+    # one size, in its own process like bench.py runs it, so that a
+    # change of the app's API shows up here and not in the next benchmark
+    output = subprocess.run([sys.executable, BENCH, '--run', '10',
+                             '--repeat', '1'], capture_output=True,
+                            text=True, check=True).stdout
+    result = json.loads(output)
+    assert set(result) >= {'load_datafile', 'new_datapoint',
+                           'update_figure', 'update_figure_total'}
+    assert all(figure['bytes'] > 0
+               for figure in result['update_figure'].values())
@@ -0,0 +1,49 @@
+import gzip
+import flask
+import compression
+
+BODY = '{"data": [' + ', '.join(['1'] * 1000) + ']}'
+
+
+def make_app(compressor):
+    server = flask.Flask(__name__)
+    compressor.init_app(server)
+    server.add_url_rule('/big', 'big', lambda: flask.Response(
+        BODY, mimetype='application/json'), methods=['GET', 'POST'])
+    server.add_url_rule('/small', 'small', lambda: flask.Response(
+        '{}', mimetype='application/json'))
+    return server.test_client()
+
+
+class TestCompressor:
+    def test_gzip(self):
+        compressor = compression.Compressor()
+        compressor._brotli = None
+        client = make_app(compressor)
+        response = client.post('/big', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert gzip.decompress(response.data).decode() == BODY
+        assert len(response.data) < len(BODY) / 10
+
+        # the compressed bytes are reused for the same response
+        again = client.post('/big', headers={'Accept-Encoding': 'gzip'})
+        assert again.data == response.data
+        assert len(compressor._cache) == 1
+
+        plain = client.get('/big')
+        assert 'Content-Encoding' not in plain.headers
+        assert plain.data.decode() == BODY
+        small = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in small.headers
+
+    def test_not_modified(self):
+        client = make_app(compression.Compressor())
+        headers = {'Accept-Encoding': 'gzip'}
+        etag = client.get('/big', headers=headers).headers['ETag']
+        headers['If-None-Match'] = etag
+        response = client.get('/big', headers=headers)
+        assert response.status_code == 304
+        assert response.data == b''
+        # callbacks are POSTs, which are always answered
+        assert client.post('/big', headers=headers).status_code == 200
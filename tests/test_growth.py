@@ -0,0 +1,85 @@
+import pytest
+import growth
+import numpy as np
+
+
+class TestDownsample:
+    def test_lttb(self):
+        x = np.arange(1000)
+        y = np.sin(x / 50)
+        keep = growth.lttb(x, y, 100)
+        assert len(keep) == 100
+        assert keep[0] == 0 and keep[-1] == 999
+        assert np.all(np.diff(keep) > 0)
+        # the peaks of the sine are kept
+        assert np.max(y[keep]) > 0.99 and np.min(y[keep]) < -0.99
+
+    def test_short(self):
+        assert list(growth.lttb([0, 1, 2], [1, 2, 3], 10)) == [0, 1, 2]
+
+    def test_downsample_nan(self):
+        x = np.arange(100)
+        weight = np.where(x % 2 == 0, x * 10.0, np.nan)
+        height = np.full(100, np.nan)
+        height[[0, 50, 99]] = [50, 60, 70]
+        keep = growth.downsample(x, [weight, height], 20)
+        assert len(keep) <= 20
+        assert {50, 99} <= set(keep)
+        assert np.all(~np.isnan(weight[keep]) | ~np.isnan(height[keep]))
+
+
+class TestReference:
+    def test_sd(self):
+        ref = growth.Reference([20, 0, 10], [30, 10, 20], [3, 1, 2])
+        z = ref.z_scores([5, 15, 25], [16, 20, 30])
+        assert z[:2] == pytest.approx([2 / 3, -2])
+        assert np.isnan(z[2])
+
+    def test_lms(self):
+        ref = growth.Reference([0, 10], lms=([0, 1], [10, 20], [0.1, 0.1]))
+        z = ref.z_scores([0, 10], [11, 22])
+        assert z == pytest.approx([np.log(1.1) / 0.1, 1])
+
+    def test_shared(self):
+        age = np.array([0, 10, 20], dtype='float32')
+        mean = np.array([10, 20, 30], dtype='float32')
+        ref = growth.Reference(age, mean, mean / 10)
+        # already sorted: no copies
+        assert ref.age is age and ref.params[0] is mean
+        assert ref.z_scores([5], [16]) == pytest.approx([2 / 3])
+        ref = growth.Reference(age[::-1], mean[::-1], mean[::-1] / 10)
+        assert list(ref.age) == [0, 10, 20]
+        assert list(ref.params[0]) == [10, 20, 30]
+
+    def test_values(self):
+        ref = growth.Reference([0, 10], [10, 20], [1, 2])
+        assert ref.values([5], 2) == pytest.approx([18])
+        lms = growth.Reference([0, 10], lms=([0, 1], [10, 20], [0.1, 0.1]))
+        z = lms.z_scores([0, 10], lms.values([0, 10], 1.5))
+        assert z == pytest.approx([1.5, 1.5])
+
+    def test_quantile(self):
+        z = growth.normal_quantile([3, 50, 97])
+        assert z == pytest.approx([-1.8808, 0, 1.8808], abs=1e-3)
+        assert growth.percentiles(z) == pytest.approx([3, 50, 97], abs=1e-3)
+
+    def test_percentiles(self):
+        assert growth.percentiles([-1.96, 0, 1]) == pytest.approx(
+            [2.5, 50, 84.13], abs=0.01)
+
+
+class TestDerived:
+    def test_velocity(self):
+        v = growth.velocity([0, 7, 14, 21], [3000, np.nan, 3200, 3300])
+        assert np.isnan(v[:2]).all()
+        assert v[2:] == pytest.approx([100, 100])
+        v = growth.velocity([28], [3400], previous=(21, 3300))
+        assert v == pytest.approx([100])
+
+    def test_bmi_wfh(self):
+        assert growth.bmi([4000], [50]) == pytest.approx([16])
+        wfh = growth.weight_for_height([4400, 5000], [55, 80],
+                                       [50, 60], [4000, 5000])
+        assert wfh[0] == pytest.approx(97.78, abs=0.01)
+        assert np.isnan(wfh[1])
+
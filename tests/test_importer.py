@@ -0,0 +1,111 @@
+import datetime as dt
+import io
+import json
+import pytest
+import setup
+import app
+import importer
+import storage
+import pandas as pd
+
+BIRTH = dt.datetime(2021, 1, 1)
+
+
+@pytest.fixture
+def settings():
+    return app.load_settings()
+
+
+@pytest.fixture
+def store(tmp_path):
+    fn = str(tmp_path / 'child.csv')
+    pd.DataFrame({'Date': ['2021-01-01', '2021-01-11'], 'Age': [0, 10],
+                  'Weight': [3500, 3900], 'Height': [50, 52],
+                  'Head_circumference': [None, None],
+                  'Comment': ['Born', None]}).to_csv(fn, index=False)
+    return storage.CsvStorage({'child': fn}, 'Age')
+
+
+class TestImport:
+    def test_csv(self, store, settings):
+        export = ('date,weight_kg,HEIGHT,notes\n'
+                  '2021-01-11,3.9,52,\n'
+                  '2021-01-21,"4,2",54,\n'
+                  '2021-01-21,4.3,,again\n'
+                  ',4.4,55,\n'
+                  '2021-01-31,4.5,56, scales \n')
+        counts = importer.import_export(
+            store, 'child', BIRTH, export, settings, 'export.csv',
+            {'Weight': 'weight_kg', 'Comment': 'notes'}, chunksize=2)
+        assert counts == {'added': 2, 'duplicates': 2, 'invalid': 1}
+        data = store.read('child')
+        assert list(data['Age']) == [0, 10, 20, 30]
+        assert list(data['Weight']) == [3500, 3900, 4200, 4500]
+        assert data['Comment'][3] == 'scales'
+
+    def test_rows_without_date(self, tmp_path, settings):
+        fn = str(tmp_path / 'old.csv')
+        pd.DataFrame({'Age': [0, 30], 'Weight': [3500, 4500],
+                      'Height': [50, 56]}).to_csv(fn, index=False)
+        store = storage.CsvStorage({'child': fn}, 'Age')
+        export = 'Date,Weight\n2021-01-31,4.5\n2021-02-10,4.8\n'
+        counts = importer.import_export(store, 'child', BIRTH, export,
+                                        settings)
+        # matched by the age of the date
+        assert counts == {'added': 1, 'duplicates': 1, 'invalid': 0}
+        assert list(store.read('child')['Age']) == [0, 30, 40]
+
+    def test_json_history(self, store, settings):
+        export = json.dumps([{'Age': 5, 'Weight': 3700},
+                             {'Age': 15, 'Height': 53}])
+        counts = importer.import_export(store, 'child', BIRTH, export,
+                                        settings, 'export.json')
+        assert counts == {'added': 2, 'duplicates': 0, 'invalid': 0}
+        data = store.read('child')
+        # the history is merged in by age
+        assert list(data['Age']) == [0, 5, 10, 15]
+        assert list(data['Date'])[1] == '2021-01-06'
+
+    def test_json_lines(self, settings):
+        lines = b'{"a": 1}\n\n{"a": 2, "b": "x"}\n'
+        chunks = list(importer.read_export(io.BytesIO(lines), 'e.jsonl'))
+        assert chunks[0].to_dict('list') == {'a': ['1', '2'],
+                                             'b': [pd.NA, 'x']}
+
+    def test_json_lines_streamed(self, settings):
+        read = []
+
+        def lines():
+            for i in range(10):
+                read.append(i)
+                yield b'{"a": %d}\n' % i
+
+        class Export(io.BytesIO):
+            # like an upload, read line by line after the first byte
+            def __iter__(self):
+                return lines()
+
+        chunks = importer.read_export(Export(b'{"a": -1}\n'), 'e.jsonl',
+                                      chunksize=3)
+        assert list(next(chunks)['a']) == ['-1', '0', '1']
+        # only the lines of the first chunk have been read
+        assert read == [0, 1]
+
+    def test_one_write(self, store, settings, monkeypatch):
+        writes = []
+        extend = store.extend
+        monkeypatch.setattr(store, 'extend', lambda *args, **kwargs:
+                            writes.append(1) or extend(*args, **kwargs))
+        export = 'Date,Weight\n' + ''.join(
+            '%s,%d\n' % (BIRTH.date() + dt.timedelta(days=day), 4000 + day)
+            for day in range(20, 1000))
+        counts = importer.import_export(store, 'child', BIRTH, export,
+                                        settings, chunksize=100)
+        assert counts['added'] == 980
+        assert writes == [1]
+        assert len(store.read('child')) == 982
+
+    def test_missing_column(self, store, settings):
+        with pytest.raises(ValueError):
+            importer.import_export(store, 'child', BIRTH, 'Date\n', settings,
+                                   mapping={'Weight': 'kg'})
@@ -0,0 +1,43 @@
+import os
+import metrics
+
+
+class TestMetrics:
+    def test_histogram(self):
+        metrics.reset()
+        metrics.observe('test_seconds', 0.003, stage='read')
+        metrics.observe('test_seconds', 20, stage='read')
+        text = metrics.render()
+        assert '# TYPE test_seconds histogram' in text
+        assert 'test_seconds_bucket{stage="read",le="0.001"} 0' in text
+        assert 'test_seconds_bucket{stage="read",le="0.005"} 1' in text
+        assert 'test_seconds_bucket{stage="read",le="+Inf"} 2' in text
+        assert 'test_seconds_count{stage="read"} 2' in text
+
+    def test_counter(self):
+        metrics.reset()
+        metrics.inc('test_total', cache='data', result='hit')
+        metrics.inc('test_total', cache='data', result='hit')
+        assert 'test_total{cache="data",result="hit"} 2' in metrics.render()
+
+    def test_slow_profile(self, tmp_path):
+        metrics.reset()
+        metrics.settings.update(slow_ms=0.001, profile_dir=str(tmp_path))
+
+        @metrics.instrument
+        def slow_callback():
+            return sum(range(100000))
+
+        try:
+            slow_callback()
+        finally:
+            metrics.settings['slow_ms'] = 0
+        assert 'gottenso_callback_seconds_count{callback="slow_callback"} 1' \
+            in metrics.render()
+        assert os.listdir(tmp_path)[0].startswith('slow_callback-')
+
+    def test_collectors(self):
+        metrics.reset()
+        text = metrics.render([lambda: [('test_total', {'app': 'a'}, 3)]])
+        assert 'test_total{app="a"} 3' in text
+        assert 'test_total' not in metrics.render()
@@ -0,0 +1,43 @@
+import json
+import pytest
+import registry
+
+
+def write_registry(tmp_path, families):
+    fn = str(tmp_path / 'registry.json')
+    with open(fn, 'w') as regfile:
+        json.dump({'families': families}, regfile)
+    return fn
+
+
+def family(children, users, parents=()):
+    return {'children': [{'name': name, 'birthday': '20210101',
+                          'file': name + '.csv'} for name in children],
+            'parents': [{'name': name, 'birthday': '19810101',
+                         'file': name + '.csv'} for name in parents],
+            'users': {name: {'password': 'pw', 'role': role}
+                      for name, role in users.items()}}
+
+
+class TestRegistry:
+    def test_from_file(self, tmp_path):
+        fn = write_registry(tmp_path, {
+            'smith': family(['Charlie', 'Dana'], {'alice': 'parent'},
+                            ['Alice']),
+            'jones': family(['Eve'], {'gran': 'family'})})
+        reg = registry.Registry.from_file(fn)
+        smith = reg.family('alice')
+        assert [child.name for child in smith.children] == ['Charlie', 'Dana']
+        assert reg.family('gran').children[0].key == 'child-jones-0'
+        assert reg.is_parent('alice') and not reg.is_parent('gran')
+        assert not reg.is_parent('nobody')
+        assert reg.passwords() == {'alice': 'pw', 'gran': 'pw'}
+        assert reg.files()['p1-smith'] == 'Alice.csv'
+        assert reg.parent_keys() == ['p1-smith']
+
+    def test_user_in_two_families(self, tmp_path):
+        fn = write_registry(tmp_path, {
+            'smith': family(['Charlie'], {'alice': 'parent'}),
+            'jones': family(['Eve'], {'alice': 'family'})})
+        with pytest.raises(ValueError):
+            registry.Registry.from_file(fn)
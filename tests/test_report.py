@@ -0,0 +1,66 @@
+import json
+import os
+import setup
+import app
+import report
+import pandas as pd
+
+
+def test_report(tmp_path):
+    cfile = str(tmp_path / 'child.csv')
+    pd.DataFrame({'Age': [0, 10], 'Weight': [3500, 3900],
+                  'Height': [50, 52], 'Comment': ['', '']}).to_csv(
+        cfile, index=False)
+    p1file = str(tmp_path / 'p1.csv')
+    settings = app.load_settings({'CFILE': cfile, 'P1FILE': p1file,
+                                  'LOGFILE': str(tmp_path / 'log.txt')})
+    directory = str(tmp_path / 'report')
+    made, current = report.make_report(
+        directory, settings, ['weight', 'parents'], [('kg', 'years')],
+        write_json=True, jobs=1)
+    assert made == ['child-weight-kg-years', 'child-parents-kg-years']
+    assert current == []
+    with open(os.path.join(directory, 'child-weight-kg-years.json')) as spec:
+        figure = json.load(spec)
+    assert figure['data'][0]['y'] == [3.5, 3.9]
+    with open(os.path.join(directory, 'child-weight-kg-years.html')) as page:
+        assert 'src="plotly.min.js"' in page.read()
+    assert os.path.exists(os.path.join(directory, 'plotly.min.js'))
+    # readable like any other new file, e.g. by a web server
+    new = str(tmp_path / 'new.txt')
+    open(new, 'w').close()
+    assert os.stat(os.path.join(directory, report.MANIFEST)).st_mode & 0o777 == \
+        os.stat(new).st_mode & 0o777
+
+    # nothing has changed
+    made, current = report.make_report(
+        directory, settings, ['weight', 'parents'], [('kg', 'years')],
+        write_json=True, jobs=1)
+    assert made == []
+
+    # only the figure with the parents' data is made again
+    pd.DataFrame({'Age': [0], 'Weight': [3500], 'Height': [50]}).to_csv(
+        p1file, index=False)
+    made, current = report.make_report(
+        directory, settings, ['weight', 'parents'], [('kg', 'years')],
+        write_json=True, jobs=1)
+    assert made == ['child-parents-kg-years']
+    assert current == ['child-weight-kg-years']
+
+
+def test_code_hash(tmp_path, monkeypatch):
+    hashed = []
+    file_hash = report.file_hash
+    monkeypatch.setattr(report, 'file_hash', lambda filename, *args: (
+        hashed.append(os.path.basename(filename)) or
+        file_hash(filename, *args)))
+    regfile = str(tmp_path / 'registry.json')
+    with open(regfile, 'w') as registry:
+        registry.write('{}')
+    settings = app.load_settings({'REGISTRY': regfile})
+    first = report.code_hash(settings)
+    assert {'app.py', 'storage.py', 'registry.py', 'base.mo',
+            'registry.json'} <= set(hashed)
+    with open(regfile, 'w') as registry:
+        registry.write('{"families": {}}')
+    assert report.code_hash(settings) != first
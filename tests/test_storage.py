@@ -0,0 +1,252 @@
+import os
+import numpy as np
+import storage
+import pandas as pd
+
+
+class TestCsvStorage:
+    def test_reads_once(self, tmp_path):
+        fn = str(tmp_path / 'data.csv')
+        pd.DataFrame({'Age': [0, 3]}).to_csv(fn, index=False)
+        store = storage.CsvStorage({'child': fn}, 'Age')
+        first = store.read('child')
+        assert store.read('child') is first
+
+    def test_reloads_changed_file(self, tmp_path):
+        fn = str(tmp_path / 'data.csv')
+        pd.DataFrame({'Age': [0, 3]}).to_csv(fn, index=False)
+        store = storage.CsvStorage({'child': fn}, 'Age')
+        assert len(store.read('child')) == 2
+        store.append('child', {'Age': 5})
+        assert len(store.read('child')) == 3
+
+    def test_convert_and_range(self, tmp_path):
+        fn = str(tmp_path / 'data.csv')
+        pd.DataFrame({'Age': [0, 3, 5, 7]}).to_csv(fn, index=False)
+        store = storage.CsvStorage({'child': fn}, 'Age')
+
+        def double(data):
+            data['Age'] *= 2
+            return data
+
+        assert list(store.read('child', double, below=5)['Age']) == [0, 6]
+        assert list(store.read('child')['Age']) == [0, 3, 5, 7]
+
+    def test_missing_file(self, tmp_path):
+        fn = os.path.join(tmp_path, 'nope.csv')
+        assert storage.file_key(fn) is None
+        assert storage.CsvStorage({'p1': fn}, 'Age').read('p1') is None
+
+    def test_keeps_mode(self, tmp_path):
+        fn = str(tmp_path / 'data.csv')
+        pd.DataFrame({'Age': [0, 3]}).to_csv(fn, index=False)
+        os.chmod(fn, 0o644)
+        store = storage.CsvStorage({'child': fn}, 'Age')
+        store.write('child', pd.DataFrame({'Age': [0, 3, 5]}))
+        assert os.stat(fn).st_mode & 0o777 == 0o644
+        storage.write_arrays(fn + '.npy', 1, store.read('child'))
+        # like any other new file
+        open(fn + '.new', 'w').close()
+        assert os.stat(fn + '.npy').st_mode & 0o777 == \
+            os.stat(fn + '.new').st_mode & 0o777
+
+
+class TestSharedArrays:
+    def test_mapped(self, tmp_path):
+        fn = str(tmp_path / 'gro.csv')
+        pd.DataFrame({'Age': [0, 3, 5], 'Weight': [3.5, 3.6, 3.7],
+                      'Note': ['a', 'b', 'c']}).to_csv(fn, index=False)
+
+        def kg_to_g(data):
+            data['Weight'] *= 1000
+            return data
+
+        store = storage.CsvStorage({'gro': fn}, 'Age', shared=('gro',))
+        data = store.read('gro', kg_to_g)
+        assert list(data.columns) == ['Age', 'Weight']
+        assert list(data['Weight']) == [3500, 3600, 3700]
+        assert data['Weight'].dtype == 'float32'
+
+        # another worker maps the converted data without converting again
+        other = storage.CsvStorage({'gro': fn}, 'Age', shared=('gro',))
+        below = other.read('gro', kg_to_g, below=4)
+        assert list(below['Weight']) == [3500, 3600]
+        values = below['Weight'].to_numpy()
+        while not isinstance(values, np.memmap):
+            values = values.base
+        assert values.filename == os.path.abspath(fn + '.npy')
+
+    def test_replaced(self, tmp_path, monkeypatch):
+        fn = str(tmp_path / 'gro.csv')
+        pd.DataFrame({'Age': [0, 10], 'Weight': [3, 4]}).to_csv(
+            fn, index=False)
+        store = storage.CsvStorage({'gro': fn}, 'Age', shared=['gro'])
+        # the .npy file is replaced for a newer version after writing it
+        monkeypatch.setattr(storage, 'read_arrays',
+                            lambda filename, version: None)
+        data = store.read('gro')
+        assert list(data['Weight']) == [3, 4]
+        assert list(store.read('gro', below=5)['Age']) == [0]
+
+    def test_stale(self, tmp_path):
+        fn = str(tmp_path / 'gro.csv')
+        pd.DataFrame({'Age': [0, 3]}).to_csv(fn, index=False)
+        store = storage.CsvStorage({'gro': fn}, 'Age', shared=('gro',))
+        assert len(store.read('gro')) == 2
+        pd.DataFrame({'Age': [0, 3, 5]}).to_csv(fn, index=False)
+        assert len(store.read('gro')) == 3
+        assert storage.read_arrays(fn + '.npy', (0, 0, 0)) is None
+
+
+class TestSqliteStorage:
+    def test_write_read(self, tmp_path):
+        store = storage.SqliteStorage(str(tmp_path / 'test.db'), 'Age')
+        assert store.read('gro') is None
+        store.write('gro', pd.DataFrame({'Age': [0, 3, 5],
+                                         'Weight': [3500, None, 3700]}))
+        data = store.read('gro')
+        assert list(data['Age']) == [0, 3, 5]
+        assert data['Weight'].isna()[1]
+        assert list(store.read('gro', below=4)['Age']) == [0, 3]
+
+    def test_append(self, tmp_path):
+        store = storage.SqliteStorage(str(tmp_path / 'test.db'), 'Age')
+        store.append('child', {'Age': 0, 'Weight': 3500})
+        first = store.read('child')
+        store.append('child', {'Age': 3, 'Comment': 'New column'})
+        data = store.read('child')
+        assert data is not first
+        assert list(data.columns) == ['Age', 'Weight', 'Comment']
+        assert data['Comment'][1] == 'New column'
+
+
+class TestAppendRow:
+    def test_append(self, tmp_path):
+        fn = str(tmp_path / 'data.csv')
+        pd.DataFrame({'Age': [0], 'Weight': [3500],
+                      'Comment': ['Born']}).to_csv(fn, index=False)
+        storage.append_row(fn, {'Age': 3, 'Weight': 3600,
+                                'Comment': 'Scales, new'})
+        storage.append_row(fn, {'Age': 5, 'Weight': float('nan')})
+        data = pd.read_csv(fn)
+        assert list(data['Age']) == [0, 3, 5]
+        assert data['Comment'][1] == 'Scales, new'
+        assert data['Weight'].isna()[2]
+
+    def test_new_column(self, tmp_path):
+        fn = str(tmp_path / 'data.csv')
+        pd.DataFrame({'Age': [0], 'Weight': [3500]}).to_csv(fn, index=False)
+        storage.append_row(fn, {'Age': 3, 'Height': 51.0})
+        assert storage.read_header(fn) == ['Age', 'Weight', 'Height']
+        assert len(pd.read_csv(fn)) == 2
+
+    def test_missing_file(self, tmp_path):
+        fn = str(tmp_path / 'data.csv')
+        storage.append_row(fn, {'Age': 3, 'Height': 51.0})
+        assert list(pd.read_csv(fn)['Age']) == [3]
+
+    def test_concurrent(self, tmp_path):
+        from concurrent.futures import ThreadPoolExecutor
+        fn = str(tmp_path / 'data.csv')
+        pd.DataFrame({'Age': [0]}).to_csv(fn, index=False)
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda age: storage.append_row(fn, {'Age': age}),
+                          range(1, 101)))
+        assert sorted(pd.read_csv(fn)['Age']) == list(range(101))
+
+
+class TestExtend:
+    def test_csv_sorted(self, tmp_path):
+        fn = str(tmp_path / 'data.csv')
+        pd.DataFrame({'Age': [0, 10], 'Weight': [1, 2]}).to_csv(
+            fn, index=False)
+        store = storage.CsvStorage({'child': fn}, 'Age')
+        store.extend('child', [{'Age': 20, 'Weight': 3}], sort_by='Age')
+        store.extend('child', [{'Age': 5, 'Weight': 4},
+                               {'Age': 30, 'Weight': 5}], sort_by='Age')
+        assert list(store.read('child')['Weight']) == [1, 4, 2, 3, 5]
+
+    def test_sqlite_sorted(self, tmp_path):
+        store = storage.SqliteStorage(str(tmp_path / 'db'), 'Age')
+        store.write('child', pd.DataFrame({'Age': [0, 10]}))
+        store.extend('child', [{'Age': 20}], sort_by='Age')
+        version = store.version('child')
+        store.extend('child', [{'Age': 5, 'Weight': 4}], sort_by='Age')
+        assert store.version('child') == version + 1
+        assert list(store.read('child')['Age']) == [0, 5, 10, 20]
+
+
+class TestJournal:
+    def test_edit_delete(self, tmp_path):
+        fn = str(tmp_path / 'data.csv')
+        pd.DataFrame({'Age': [0, 10, 20], 'Weight': [1, 2, 3]}).to_csv(
+            fn, index=False)
+        store = storage.CsvStorage({'child': fn}, 'Age')
+        assert store.index('child') == {0: 0, 10: 1, 20: 2}
+        key = storage.file_key(fn)
+        store.edit('child', np.int64(10), {'Weight': 5, 'Comment': 'x'})
+        store.delete('child', 0)
+        # the .csv file is left alone until the journal is compacted
+        assert storage.file_key(fn) == key
+        data = store.read('child')
+        assert list(data['Weight']) == [5, 3]
+        assert list(data['Comment'].fillna('')) == ['x', '']
+        assert store.index('child') == {10: 0, 20: 1}
+
+        store.compact('child')
+        assert not os.path.exists(fn + '.journal')
+        assert list(pd.read_csv(fn)['Weight']) == [5, 3]
+        assert store.read('child')['Weight'].tolist() == [5, 3]
+
+    def test_index_bounded(self, tmp_path):
+        import gc
+        import weakref
+
+        files = {}
+        for name in ('a', 'b'):
+            files[name] = str(tmp_path / (name + '.csv'))
+            pd.DataFrame({'Age': [0, 10]}).to_csv(files[name], index=False)
+        store = storage.CsvStorage(files, 'Age', cache_size=1)
+        assert store.index('a') == {0: 0, 10: 1}
+        data = weakref.ref(store.read('a'))
+        assert store.index('a') is store.index('a')
+        store.read('b')
+        gc.collect()
+        # dropped from the cache, with its index
+        assert data() is None
+
+    def test_delete_and_add(self, tmp_path):
+        fn = str(tmp_path / 'data.csv')
+        pd.DataFrame({'Age': [0, 10], 'Weight': [1, 20]}).to_csv(
+            fn, index=False)
+        store = storage.CsvStorage({'child': fn}, 'Age')
+        # a typo deleted, and the data point added again
+        store.delete('child', 10)
+        store.append('child', {'Age': 10, 'Weight': 2})
+        assert list(store.read('child')['Weight']) == [1, 2]
+        # and an edit before an import at the same age
+        store.edit('child', 0, {'Weight': 3})
+        store.extend('child', [{'Age': 0, 'Weight': 4}], sort_by='Age')
+        assert list(store.read('child')['Weight']) == [3, 4, 2]
+        store.compact('child')
+        assert list(pd.read_csv(fn)['Weight']) == [3, 4, 2]
+
+    def test_compacts(self, tmp_path):
+        fn = str(tmp_path / 'data.csv')
+        pd.DataFrame({'Age': [0, 10]}).to_csv(fn, index=False)
+        store = storage.CsvStorage({'child': fn}, 'Age', journal_size=3)
+        for weight in (1, 2):
+            store.edit('child', 0, {'Weight': weight})
+        assert os.path.exists(fn + '.journal')
+        store.edit('child', 10, {'Weight': 3})
+        assert not os.path.exists(fn + '.journal')
+        assert list(pd.read_csv(fn)['Weight']) == [2, 3]
+
+    def test_sqlite(self, tmp_path):
+        store = storage.SqliteStorage(str(tmp_path / 'db'), 'Age')
+        store.write('child', pd.DataFrame({'Age': [0, 10, 20]}))
+        store.edit('child', 10, {'Weight': 5})
+        store.delete('child', 0)
+        data = store.read('child')
+        assert list(data['Age']) == [10, 20]
+        assert data['Weight'][0] == 5